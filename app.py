@@ -1,218 +1,794 @@
-# app.py
-import os
-import uuid
-import time
-import threading
-import shutil
-from flask import Flask, request, jsonify, send_from_directory, abort
-
-# --- Config (adjust if you want absolute paths) ---
-ROOT = os.path.abspath(os.getcwd())               # project root (where app.py lives)
-UPLOADS = os.path.join(ROOT, "uploads")
-OUTPUTS = os.path.join(ROOT, "output")
-TOOLS   = os.path.join(ROOT, "tools")
-
-os.makedirs(UPLOADS, exist_ok=True)
-os.makedirs(OUTPUTS, exist_ok=True)
-os.makedirs(TOOLS, exist_ok=True)
-
-# Tool default paths (will be used by convert function)
-TESSERACT = os.environ.get("TESSERACT_PATH") or os.path.join(TOOLS, "tesseract", "tesseract.exe")
-POPPLER_BIN = os.environ.get("POPPLER_PATH") or os.path.join(TOOLS, "poppler", "bin")
-JAVA_EXE = os.environ.get("JAVA_PATH") or os.path.join(TOOLS, "java", "bin", "java.exe")
-TABULA_JAR = os.environ.get("TABULA_JAR") or os.path.join(TOOLS, "tabula", "tabula.jar")
-
-# Try to import the user's convert_all_in_one.convert_pdf_to_docx function if present
-convert_func = None
-try:
-    import convert_all_in_one as converter_module
-    if hasattr(converter_module, "convert_pdf_to_docx"):
-        convert_func = converter_module.convert_pdf_to_docx
-except Exception:
-    convert_func = None
-
-# If convert_all_in_one not present, we'll implement a minimal fallback using pdf2docx + OCR
-def fallback_convert(pdf_path, out_docx):
-    """
-    Simple fallback conversion:
-     - tries pdf2docx for digital PDFs
-     - otherwise rasterizes pages via poppler (if available) and runs tesseract OCR
-    This is intentionally conservative and intended as a working fallback.
-    """
-    from pdf2docx import Converter as PDF2DOCX
-    from pdf2image import convert_from_path
-    from docx import Document
-    import pytesseract
-    # set tesseract path if available
-    if os.path.exists(TESSERACT):
-        try:
-            import pytesseract as _pt
-            _pt.pytesseract.tesseract_cmd = TESSERACT
-        except Exception:
-            pass
-
-    # quick embedded text detection (first 3 pages)
-    has_text = False
-    try:
-        import pdfplumber
-        with pdfplumber.open(pdf_path) as pdf:
-            sample = "".join((pdf.pages[i].extract_text() or "") for i in range(min(3, len(pdf.pages))))
-            has_text = len(sample.strip()) > 50
-    except Exception:
-        has_text = False
-
-    # If PDF has selectable text, try pdf2docx
-    if has_text:
-        try:
-            cv = PDF2DOCX(pdf_path)
-            cv.convert(out_docx, start=0, end=None)
-            cv.close()
-            return True
-        except Exception:
-            pass
-
-    # fallback OCR per-page (high-DPI)
-    imgs = convert_from_path(pdf_path, dpi=300, poppler_path=POPPLER_BIN if os.path.exists(POPPLER_BIN) else None)
-    doc = Document()
-    for i, img in enumerate(imgs):
-        txt = pytesseract.image_to_string(img)
-        for line in txt.splitlines():
-            if line.strip():
-                doc.add_paragraph(line)
-        if i != len(imgs) - 1:
-            doc.add_page_break()
-
-    doc.save(out_docx)
-    return True
-
-# use selected conversion function (user-provided or fallback)
-def run_conversion(pdf_path, out_docx, progress_callback=None):
-    # prefer user convert_func if available
-    if convert_func:
-        # try calling user implementation; many user scripts accept (pdf_path, out_docx)
-        try:
-            # If convert_func uses tools relative to project root, ensure current env knows them
-            os.environ["TESSERACT_PATH"] = TESSERACT
-            os.environ["POPPLER_PATH"] = POPPLER_BIN
-            os.environ["JAVA_PATH"] = JAVA_EXE
-            os.environ["TABULA_JAR"] = TABULA_JAR
-            return bool(convert_func(pdf_path, out_docx))
-        except Exception as e:
-            # fallback on error
-            print("convert_all_in_one failed:", e)
-            return fallback_convert(pdf_path, out_docx)
-    else:
-        return fallback_convert(pdf_path, out_docx)
-
-
-# In-memory job store (for simplicity)
-jobs = {}  # job_id -> {status, progress, in, out, error}
-
-app = Flask(__name__, static_folder='.', static_url_path='')
-
-@app.route("/")
-def index():
-    return app.send_static_file("index.html")
-
-# helper
-def allowed_pdf(fname):
-    return fname.lower().endswith(".pdf")
-
-@app.route("/upload", methods=["POST"])
-def upload():
-    if "file" not in request.files:
-        return "no file", 400
-    f = request.files["file"]
-    if f.filename == "":
-        return "empty filename", 400
-    if not allowed_pdf(f.filename):
-        return "only pdf allowed", 400
-
-    job_id = str(uuid.uuid4())
-    in_name = job_id + ".pdf"
-    in_path = os.path.join(UPLOADS, in_name)
-    f.save(in_path)
-
-    out_name = job_id + ".docx"
-    out_path = os.path.join(OUTPUTS, out_name)
-
-    jobs[job_id] = {"status": "queued", "progress": 0, "in": in_name, "out": None, "error": None}
-
-    # start background thread
-    thread = threading.Thread(target=_worker, args=(job_id, in_path, out_path), daemon=True)
-    thread.start()
-
-    return jsonify({"id": job_id})
-
-def _worker(job_id, in_path, out_path):
-    try:
-        jobs[job_id]["status"] = "processing"
-        jobs[job_id]["progress"] = 5
-
-        # run conversion (report rough progress)
-        jobs[job_id]["progress"] = 10
-        success = run_conversion(in_path, out_path, progress_callback=None)
-
-        # ensure file was created and is reasonable size
-        if not success or not os.path.exists(out_path) or os.path.getsize(out_path) < 1024:
-            # Try a final fallback: if pdf2docx can at least export something
-            try:
-                # attempt one more time with fallback converter
-                ok = fallback_convert(in_path, out_path)
-            except Exception as e:
-                ok = False
-                print("fallback final attempt failed:", e)
-
-            if (not ok) or (not os.path.exists(out_path)) or os.path.getsize(out_path) < 1024:
-                jobs[job_id]["status"] = "error"
-                jobs[job_id]["error"] = "Conversion failed or output corrupted (file missing or too small)."
-                jobs[job_id]["progress"] = 0
-                return
-
-        # success
-        jobs[job_id]["out"] = os.path.basename(out_path)
-        jobs[job_id]["progress"] = 100
-        jobs[job_id]["status"] = "done"
-    except Exception as e:
-        jobs[job_id]["status"] = "error"
-        jobs[job_id]["error"] = str(e)
-        jobs[job_id]["progress"] = 0
-
-@app.route("/status")
-def status():
-    job_id = request.args.get("id")
-    if not job_id or job_id not in jobs:
-        return jsonify({"status": "error", "message": "invalid id"}), 404
-    j = jobs[job_id]
-    return jsonify({
-        "status": j.get("status"),
-        "progress": j.get("progress", 0),
-        "out": j.get("out"),
-        "message": j.get("error")
-    })
-
-@app.route("/download")
-def download():
-    fname = request.args.get("file")
-    if not fname:
-        return "missing file", 400
-    safe = os.path.basename(fname)
-    path = os.path.join(OUTPUTS, safe)
-    if not os.path.exists(path):
-        return "file not found", 404
-    # final validation: docx must be > 1 KB
-    if os.path.getsize(path) < 1024:
-        return "file corrupted or too small", 500
-    return send_from_directory(OUTPUTS, safe, as_attachment=True)
-
-if __name__ == "__main__":
-    # helpful startup messages
-    print("Project root:", ROOT)
-    print("Uploads folder:", UPLOADS)
-    print("Outputs folder:", OUTPUTS)
-    print("Tools lookup:", TOOLS)
-    print("Tesseract path:", TESSERACT)
-    print("Poppler bin:", POPPLER_BIN)
-    print("Java exe:", JAVA_EXE)
-    print("Tabula jar:", TABULA_JAR)
-    app.run(host="0.0.0.0", port=5000, debug=True)
+# app.py
+import os
+import sys
+import json
+import uuid
+import time
+import threading
+import shutil
+import zipfile
+from flask import Flask, Request, Response, request, jsonify, send_from_directory, abort
+from scheduler import JobScheduler, QueueFull
+from workers import ConverterProcess
+from result_cache import ResultCache, cache_key
+from ingest import IngestFile, SpooledUpload, UploadRejected
+from ocr_engine import ocr_files
+from warmup import WarmUp
+from job_store import FINISHED, JobStore, SQLiteJobStore, Janitor
+from job_cost import estimate as estimate_cost, memory_budget_mb
+from zip_stream import ZipStream
+import metrics
+from metrics import stage
+import conversion
+from conversion import (CONVERT_WORKERS, CPU_BUDGET, JAVA_EXE, LAYOUT_JOBS, OCR_DPI, OCR_THREADS_PER_JOB,
+                        OCR_WINDOW, POPPLER_BIN, TABULA_JAR, TESSERACT, load_converter)
+
+# --- Config (adjust if you want absolute paths) ---
+ROOT = os.path.abspath(os.getcwd())               # project root (where app.py lives)
+UPLOADS = os.path.join(ROOT, "uploads")
+OUTPUTS = os.path.join(ROOT, "output")
+SERVER_OUTPUTS = os.path.join(ROOT, "outputs")  # server.py
+TOOLS   = os.path.join(ROOT, "tools")
+
+os.makedirs(UPLOADS, exist_ok=True)
+os.makedirs(OUTPUTS, exist_ok=True)
+os.makedirs(TOOLS, exist_ok=True)
+
+# Worker pool sizing: at most CONVERT_WORKERS conversions run at once, and at most
+# CONVERT_QUEUE_MAX uploads wait behind them before /upload starts answering 503.
+# CONVERT_WORKERS, CPU_BUDGET, the tool paths and the OCR settings live in conversion.py.
+CONVERT_QUEUE_MAX = int(os.environ.get("CONVERT_QUEUE_MAX") or 20)
+
+# Uploaded PDFs are written to uploads/ as the request body arrives, hashed and checked
+# on the way: one over MAX_UPLOAD_MB, or over MAX_UPLOAD_PAGES pages, is refused with 413
+# mid-upload, and one that is not a readable PDF or needs a password with 400 (0 = no limit)
+MAX_UPLOAD_MB = int(os.environ.get("MAX_UPLOAD_MB") or 200)
+MAX_UPLOAD_PAGES = int(os.environ.get("MAX_UPLOAD_PAGES") or 2000)
+
+# /download sets ETag / Last-Modified and answers Range requests itself; behind a front
+# server it can hand the file over instead: USE_X_SENDFILE=1 (Apache, lighttpd) or
+# X_ACCEL_REDIRECT=/internal-location-of-output/ (nginx)
+USE_X_SENDFILE = (os.environ.get("USE_X_SENDFILE") or "0") == "1"
+X_ACCEL_REDIRECT = os.environ.get("X_ACCEL_REDIRECT") or ""
+
+# POST /batch takes up to BATCH_MAX_FILES PDFs, side by side or inside ZIP files (at most
+# BATCH_MAX_MB per ZIP file and unzipped, 0 = no limit). Documents the queue has no room
+# for wait and join it as it drains; up to BATCH_MAX_FILES of them may wait at once
+BATCH_MAX_FILES = int(os.environ.get("BATCH_MAX_FILES") or 100)
+BATCH_MAX_MB = int(os.environ.get("BATCH_MAX_MB") or 1024)
+# no request body may be larger than the largest of those (plus room for the form fields)
+MAX_REQUEST_MB = max(MAX_UPLOAD_MB, BATCH_MAX_MB) + 1 if MAX_UPLOAD_MB and BATCH_MAX_MB else 0
+
+# "thread" runs conversions inside this process; "process" gives every worker its own
+# pre-warmed converter process, recycled after N jobs or once it grows past the RSS ceiling
+CONVERT_EXECUTOR = os.environ.get("CONVERT_EXECUTOR") or "thread"
+WORKER_MAX_JOBS = int(os.environ.get("WORKER_MAX_JOBS") or 50)
+WORKER_MAX_RSS_MB = int(os.environ.get("WORKER_MAX_RSS_MB") or 1500)
+
+OCR_PROFILES = ("fast", "balanced", "quality")
+DEFAULT_OCR_PROFILE = os.environ.get("OCR_PROFILE") or "balanced"
+# "fast" skips layout analysis and tables: text, headings and page breaks only
+MODES = ("layout", "fast")
+
+# Finished DOCX files are reused for byte-identical uploads with the same options
+RESULT_CACHE_MB = int(os.environ.get("RESULT_CACHE_MB") or 1024)
+
+# Each upload gets a cost estimate (pages, scanned pages, seconds, memory at OCR_DPI).
+# Queued jobs start shortest estimate first, each second waited counting JOB_AGING
+# seconds off, and only while the running jobs' estimates fit MEMORY_BUDGET_MB and CPU_BUDGET
+MEMORY_BUDGET_MB = int(os.environ.get("MEMORY_BUDGET_MB") or memory_budget_mb())
+JOB_AGING = float(os.environ.get("JOB_AGING") or 1.0)
+
+# A running job is stopped (status "timed_out") after JOB_TIMEOUT_SECONDS, or once one
+# progress stage runs longer than its STAGE_TIMEOUTS limit, e.g. "ocr=1800,tables=300"; 0 = no limit
+JOB_TIMEOUT_SECONDS = int(os.environ.get("JOB_TIMEOUT_SECONDS") or 3600)
+STAGE_TIMEOUTS = {name.strip(): int(limit) for name, limit in
+                  (item.split("=", 1) for item in (os.environ.get("STAGE_TIMEOUTS") or "").split(",") if "=" in item)}
+
+# Finished job records and their files are dropped JOB_TTL_SECONDS after the job ends;
+# at most JOB_STORE_MAX records are kept, and the janitor keeps each output folder
+# under DISK_BUDGET_MB by deleting the oldest unreferenced files first
+JOB_TTL_SECONDS = int(os.environ.get("JOB_TTL_SECONDS") or 86400)
+JOB_STORE_MAX = int(os.environ.get("JOB_STORE_MAX") or 10000)
+DISK_BUDGET_MB = int(os.environ.get("DISK_BUDGET_MB") or 4096)
+JANITOR_INTERVAL = int(os.environ.get("JANITOR_INTERVAL") or 300)
+
+# Job records and the queue live in this SQLite file, so any number of web and worker
+# processes on this host can share them (a local disk only: SQLite's WAL mode does not
+# work over network filesystems, so not across hosts); JOB_DB=memory keeps them inside
+# this process. A worker renews its claim on a running job every JOB_LEASE_SECONDS / 3;
+# jobs of a worker that stopped doing so are run again.
+JOB_DB = os.environ.get("JOB_DB") or os.path.join(OUTPUTS, ".jobs.sqlite3")
+JOB_LEASE_SECONDS = int(os.environ.get("JOB_LEASE_SECONDS") or 60)
+
+# WARMUP=1 imports the converters' dependencies, checks the tools and starts the OCR and
+# table engines in the background as soon as the server runs; /readyz reports 503 until then
+WARMUP = (os.environ.get("WARMUP") or "1") != "0"
+
+# each scheduler worker thread owns one converter process in "process" mode
+_local = threading.local()
+
+def _converter():
+    """This worker thread's converter process ("process" mode)."""
+    proc = getattr(_local, "proc", None)
+    if proc is None:
+        proc = _local.proc = ConverterProcess(max_jobs=WORKER_MAX_JOBS, max_rss_mb=WORKER_MAX_RSS_MB)
+    return proc
+
+def _execute(func_name, *args, progress=None, tmpdir=None, **kwargs):
+    """
+    Run one of conversion.py's functions in the configured executor;
+    progress(stage, done, total) receives its page progress either way.
+    """
+    if progress is not None and progress.stopped:
+        raise JobStopped(*progress.stopped)
+    if CONVERT_EXECUTOR != "process":
+        return getattr(conversion, func_name)(*args, progress_callback=progress, **kwargs)
+    result, spans = _converter().call("conversion:_traced_call", func_name, progress is not None, args, kwargs, tmpdir,
+                                      on_progress=progress)
+    metrics.add_spans(spans)
+    return result
+
+
+# Job store: job_id -> {status, progress, stage, pages_done, pages_total, eta_seconds,
+#                       in, out, error, key, options, stages, finished,
+#                       cost_seconds, mem_mb, cpu, batch, name}
+if JOB_DB == "memory":
+    jobs = JobStore(ttl=JOB_TTL_SECONDS, max_entries=JOB_STORE_MAX, aging=JOB_AGING)
+else:
+    jobs = SQLiteJobStore(JOB_DB, ttl=JOB_TTL_SECONDS, max_entries=JOB_STORE_MAX, aging=JOB_AGING)
+
+# outputs a job record still points at stay on disk until the record expires
+result_cache = ResultCache(OUTPUTS, RESULT_CACHE_MB * 1024 * 1024, pinned=jobs.referenced_files)
+
+janitor = Janitor(jobs, [(UPLOADS, None),
+                         (OUTPUTS, DISK_BUDGET_MB * 1024 * 1024),
+                         (SERVER_OUTPUTS, DISK_BUDGET_MB * 1024 * 1024)],
+                  ttl=JOB_TTL_SECONDS, interval=JANITOR_INTERVAL, keep=result_cache.files)
+
+def _pipeline():
+    """
+    The converter jobs will run, without importing it in the request: the one this process
+    loaded, else the warm-up's import of it, else whether convert_all_in_one can be found.
+    """
+    available = conversion.converter_loaded()
+    if available is None:
+        imported = warm.report()["imports"].get("convert_all_in_one")
+        if imported is not None:
+            available = imported["ok"]
+        else:
+            import importlib.util
+            available = importlib.util.find_spec("convert_all_in_one") is not None
+    return "convert_all_in_one" if available else "fallback"
+
+def _conversion_options(form):
+    """Everything besides the PDF bytes that changes the produced DOCX (part of the cache key)."""
+    return {
+        "pipeline": _pipeline(),
+        "ocr_profile": form.get("profile") or DEFAULT_OCR_PROFILE,
+        "mode": form.get("mode") or "layout",
+    }
+
+class UploadRequest(Request):
+    """
+    Request whose PDF file parts stream straight into UPLOADS (see ingest.IngestFile); other
+    file parts are spooled up to BATCH_MAX_MB (ZIP files) or MAX_UPLOAD_MB.
+    """
+
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        if not filename:
+            return super()._get_file_stream(total_content_length, content_type, filename, content_length)
+        if allowed_pdf(filename):
+            return _ingest_file()
+        limit_mb = BATCH_MAX_MB if filename.lower().endswith(".zip") else MAX_UPLOAD_MB
+        return SpooledUpload(limit_mb * 1024 * 1024)
+
+def _ingest_file():
+    # tracked on the request, so teardown removes the uploads no job took over
+    f = IngestFile(UPLOADS, max_bytes=MAX_UPLOAD_MB * 1024 * 1024, max_pages=MAX_UPLOAD_PAGES)
+    request.environ.setdefault("pdf_to_word.ingested", []).append(f)
+    return f
+
+app = Flask(__name__, static_folder='.', static_url_path='')
+app.request_class = UploadRequest
+app.config["MAX_CONTENT_LENGTH"] = MAX_REQUEST_MB * 1024 * 1024 or None
+app.use_x_sendfile = USE_X_SENDFILE
+
+@app.errorhandler(UploadRejected)
+def upload_rejected(e):
+    return str(e), e.status
+
+@app.teardown_request
+def _discard_uploads(exc):
+    for f in request.environ.get("pdf_to_word.ingested", ()):
+        if not f.kept:
+            f.discard()
+
+@app.route("/")
+def index():
+    return app.send_static_file("index.html")
+
+# helper
+def allowed_pdf(fname):
+    return fname.lower().endswith(".pdf")
+
+@app.route("/upload", methods=["POST"])
+def upload():
+    if "file" not in request.files:
+        return "no file", 400
+    f = request.files["file"]
+    if f.filename == "":
+        return "empty filename", 400
+    if not allowed_pdf(f.filename):
+        return "only pdf allowed", 400
+    options = _conversion_options(request.form)
+    invalid = _invalid_options(options)
+    if invalid:
+        return invalid, 400
+
+    janitor.start()
+    warm.start()
+    # already stored and hashed while the request came in
+    pdf = f.stream.finish()
+    job_id = pdf.name[:-len(".pdf")]
+
+    # identical PDF + options: serve the finished DOCX, or attach to the running job
+    record = _new_job(job_id, pdf, options)
+    if record["status"] == "done":
+        return jsonify({"id": job_id, "cached": True})
+    running = jobs.find_active(record["key"])
+    if running:
+        return jsonify({"id": running, "attached": True, "queue_position": scheduler.position(running)})
+
+    # hand off to the worker pool; refuse instead of piling up when the queue is full
+    try:
+        scheduler.submit(job_id, record)
+    except QueueFull as e:
+        return _queue_full(e)
+    pdf.kept = True
+
+    return jsonify({"id": job_id, "queue_position": scheduler.position(job_id)})
+
+def _invalid_options(options):
+    if options["ocr_profile"] not in OCR_PROFILES:
+        return "profile must be one of: " + ", ".join(OCR_PROFILES)
+    if options["mode"] not in MODES:
+        return "mode must be one of: " + ", ".join(MODES)
+    return None
+
+def _queue_full(e):
+    resp = jsonify({"status": "error", "message": "server busy, retry later"})
+    resp.status_code = 503
+    resp.headers["Retry-After"] = str(e.retry_after)
+    return resp
+
+def _new_job(job_id, pdf, options, **fields):
+    """
+    Record for an ingested PDF: a finished one pointing at the cached DOCX when this PDF
+    was converted with these options before (the record is stored), otherwise a "queued"
+    one with its cost estimate, for the caller to submit (and then set pdf.kept).
+    """
+    key = cache_key(pdf.sha256, options)
+    cached = result_cache.get(key)
+    if cached:
+        record = dict(fields, status="done", progress=100, out=cached, error=None, key=key)
+        record["in"] = None
+        jobs.add(job_id, record)
+        jobs.finish(job_id)
+        return record
+
+    record = dict(fields, status="queued", progress=0, out=None, error=None, key=key, options=options)
+    record["in"] = pdf.name
+    try:
+        cost = estimate_cost(pdf.path, options["mode"], OCR_DPI, OCR_THREADS_PER_JOB, OCR_WINDOW, LAYOUT_JOBS)
+        record.update(pages_total=cost["pages"], cost_seconds=cost["cost_seconds"],
+                      mem_mb=cost["mem_mb"], cpu=cost["cpu"])
+    except Exception as e:
+        print("cost estimate failed:", e)
+    return record
+
+# Overall progress band of each stage; the job is at 10% when conversion starts
+PROGRESS_BANDS = {"ocr": (10, 50), "layout": (50, 80), "docx": (80, 90), "tables": (90, 98), "text": (50, 98)}
+
+# woken on every progress write in this process, so /events streams without waiting a poll tick
+_progress_cond = threading.Condition()
+
+def _notify_progress():
+    with _progress_cond:
+        _progress_cond.notify_all()
+
+class JobStopped(BaseException):
+    """
+    Raised into a conversion running in this thread once its job is cancelled or timed out.
+    A BaseException, so the converters' broad `except Exception` fallbacks let it through.
+    """
+
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+class _JobProgress:
+    """
+    progress_callback for one job: page counts -> overall percent and ETA in the job store.
+    It also tracks the current stage for STAGE_TIMEOUTS and is how a job gets stopped.
+    """
+
+    def __init__(self, job_id, proc=None):
+        self.job_id = job_id
+        self.proc = proc              # converter process running the job ("process" mode)
+        self.t0 = time.monotonic()
+        self.percent = 10
+        self.stage = None
+        self.stage_started = self.t0
+        self.stopped = None           # (status, message) once cancelled or timed out
+        self._last = 0.0
+
+    def overdue(self):
+        now = time.monotonic()
+        if JOB_TIMEOUT_SECONDS and now - self.t0 > JOB_TIMEOUT_SECONDS:
+            return "timed_out", "Conversion took longer than %d seconds." % JOB_TIMEOUT_SECONDS
+        limit = STAGE_TIMEOUTS.get(self.stage)
+        if limit and now - self.stage_started > limit:
+            return "timed_out", "The %s stage took longer than %d seconds." % (self.stage, limit)
+        return None
+
+    def stop(self, status, message):
+        self.stopped = (status, message)
+        # a converter process is killed with its children; a thread stops at its next progress call
+        if self.proc is not None:
+            self.proc.kill()
+
+    def __call__(self, stage_name, done, total):
+        if self.stopped and self.proc is None:
+            raise JobStopped(*self.stopped)
+        if stage_name != self.stage:
+            self.stage, self.stage_started = stage_name, time.monotonic()
+        lo, hi = PROGRESS_BANDS.get(stage_name, (10, 98))
+        # stages may run in a different order (fallback), so never move backwards
+        self.percent = max(self.percent, lo + (hi - lo) * done / total if total else lo)
+        now = time.monotonic()
+        if done < total and now - self._last < 0.5:
+            return    # at most two store writes per second, plus the end of each stage
+        self._last = now
+        elapsed = now - self.t0
+        eta = elapsed * (100 - self.percent) / (self.percent - 10) if self.percent > 10 else None
+        jobs.update(self.job_id, progress=int(self.percent), stage=stage_name, pages_done=done,
+                    pages_total=total, eta_seconds=round(eta, 1) if eta is not None else None)
+        _notify_progress()
+
+def _watch(job_id, progress, finished):
+    """Stops the job on /cancel, or once it runs past JOB_TIMEOUT_SECONDS or a stage limit."""
+    while not finished.wait(1.0):
+        reason = progress.overdue()
+        if reason is None:
+            j = jobs.get(job_id)
+            if j is not None and j.get("cancel_requested"):
+                reason = ("cancelled", "Cancelled by the user.")
+        if reason is not None:
+            progress.stop(*reason)
+            return
+
+def _worker(job_id):
+    job = jobs.get(job_id)
+    if job is None:
+        return
+    in_path = os.path.join(UPLOADS, job["in"])
+    out_path = os.path.join(OUTPUTS, job_id + ".docx")
+    t0 = time.perf_counter()
+    metrics.begin_trace()
+    result = {}
+    progress = _JobProgress(job_id, _converter() if CONVERT_EXECUTOR == "process" else None)
+    tmpdir = None
+    if progress.proc is not None:
+        import tempfile
+        tmpdir = tempfile.mkdtemp(prefix="job-%s-" % job_id[:8])
+    finished = threading.Event()
+    threading.Thread(target=_watch, args=(job_id, progress, finished), name="watch-" + job_id[:8],
+                     daemon=True).start()
+    try:
+        # run conversion (report rough progress)
+        jobs.update(job_id, progress=10)
+        with stage("convert"):
+            success = _execute("run_conversion", in_path, out_path, options=job["options"],
+                               progress=progress, tmpdir=tmpdir)
+
+        # ensure file was created and is reasonable size
+        if not success or not os.path.exists(out_path) or os.path.getsize(out_path) < 1024:
+            # Try a final fallback: if pdf2docx can at least export something
+            try:
+                # attempt one more time with fallback converter
+                with stage("retry_fallback"):
+                    ok = _execute("fallback_convert", in_path, out_path, progress=progress, tmpdir=tmpdir,
+                                  mode=job["options"].get("mode", "layout"))
+            except Exception as e:
+                ok = False
+                print("fallback final attempt failed:", e)
+
+            if (not ok) or (not os.path.exists(out_path)) or os.path.getsize(out_path) < 1024:
+                result = {"status": "error", "progress": 0,
+                          "error": "Conversion failed or output corrupted (file missing or too small)."}
+                return
+
+        # scanned pages come out of pdf2docx as full-resolution images; a failure here
+        # leaves the (valid, just larger) document as it is
+        try:
+            _execute("optimize_output", out_path, progress=progress, tmpdir=tmpdir)
+        except Exception as e:
+            print("image optimization skipped:", e)
+
+        # success
+        result = {"status": "done", "progress": 100, "out": os.path.basename(out_path)}
+        result_cache.put(job["key"], result["out"])
+    except (Exception, JobStopped) as e:
+        result = {"status": "error", "progress": 0, "error": str(e)}
+    finally:
+        finished.set()
+        if progress.stopped:
+            # whatever the conversion got to, the job counts as cancelled / timed out
+            result = {"status": progress.stopped[0], "progress": 0, "error": progress.stopped[1], "out": None}
+            if os.path.exists(out_path):
+                os.remove(out_path)
+        if tmpdir:
+            shutil.rmtree(tmpdir, ignore_errors=True)
+        spans = metrics.end_trace()
+        metrics.registry.observe_job(spans, time.perf_counter() - t0, result.get("status", "error"))
+        # the upload is not needed once the job has finished either way
+        if os.path.exists(in_path):
+            os.remove(in_path)
+        result.update({"in": None, "stages": spans, "eta_seconds": None})
+        jobs.update(job_id, **result)
+        jobs.finish(job_id)
+        _notify_progress()
+
+scheduler = JobScheduler(_worker, jobs, workers=CONVERT_WORKERS, max_queue=CONVERT_QUEUE_MAX,
+                         lease=JOB_LEASE_SECONDS, budget={"mem_mb": MEMORY_BUDGET_MB, "cpu": CPU_BUDGET},
+                         max_waiting=BATCH_MAX_FILES)
+
+def _prime_ocr():
+    # one tiny tesseract run, so the first scanned page does not pay for loading traineddata
+    import tempfile
+    from PIL import Image
+    with tempfile.TemporaryDirectory() as td:
+        path = os.path.join(td, "blank.png")
+        Image.new("L", (200, 60), 255).save(path)
+        ocr_files([path], cmd=TESSERACT if os.path.exists(TESSERACT) else None)
+
+def _prime_tables():
+    from table_extractor import get_session
+    get_session()
+
+warm = WarmUp(
+    tools={
+        "tesseract": (TESSERACT, "tesseract", ["--version"]),
+        "poppler": (os.path.join(POPPLER_BIN, "pdftoppm.exe" if os.name == "nt" else "pdftoppm"), "pdftoppm", ["-v"]),
+        "java": (JAVA_EXE, "java", ["-version"]),
+    },
+    primers={"converter": load_converter, "ocr": _prime_ocr, "tables": _prime_tables},
+    enabled=WARMUP)
+
+@app.route("/healthz")
+def healthz():
+    """Liveness: the process is up and serving requests."""
+    return jsonify({"status": "ok"})
+
+@app.route("/readyz")
+def readyz():
+    """Readiness: 503 until the warm-up has finished, then per-dependency import and warm-up times."""
+    warm.start()
+    report = warm.report()
+    try:
+        jobs.queued()
+        report["job_store"] = {"ok": True}
+    except Exception as e:
+        report["job_store"] = {"ok": False, "error": str(e)}
+    ok = report["ready"] and report["job_store"]["ok"]
+    return jsonify(report), 200 if ok else 503
+
+@app.route("/status")
+def status():
+    job_id = request.args.get("id")
+    j = jobs.get(job_id) if job_id else None
+    if j is None:
+        return jsonify({"status": "error", "message": "invalid id"}), 404
+    return jsonify(_status_payload(job_id, j))
+
+def _status_payload(job_id, j):
+    return {
+        "status": j.get("status"),
+        "progress": j.get("progress") or 0,
+        "stage": j.get("stage"),
+        "pages_done": j.get("pages_done"),
+        "pages_total": j.get("pages_total"),
+        "eta_seconds": j.get("eta_seconds"),
+        "out": j.get("out"),
+        "message": j.get("error"),
+        "queue_position": scheduler.position(job_id) if j.get("status") == "queued" else None,
+        "stages": j.get("stages") or []
+    }
+
+@app.route("/events")
+def events():
+    """Server-sent events: the /status payload each time it changes, until the job finishes."""
+    job_id = request.args.get("id")
+    if not job_id or job_id not in jobs:
+        return jsonify({"status": "error", "message": "invalid id"}), 404
+
+    def stream():
+        last, quiet = None, 0.0
+        yield "retry: 2000\n\n"
+        while True:
+            j = jobs.get(job_id)
+            if j is None:
+                yield "event: gone\ndata: {}\n\n"
+                return
+            data = json.dumps(_status_payload(job_id, j))
+            if data != last:
+                yield "data: %s\n\n" % data
+                last, quiet = data, 0.0
+            elif quiet >= 15:
+                # comment line keeps proxies from closing an idle stream
+                yield ": keep-alive\n\n"
+                quiet = 0.0
+            if j.get("status") in FINISHED:
+                return
+            # local progress wakes us at once; jobs run by other processes are seen within a second
+            with _progress_cond:
+                _progress_cond.wait(1.0)
+            quiet += 1.0
+
+    return Response(stream(), mimetype="text/event-stream",
+                    headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+@app.route("/cancel", methods=["POST"])
+def cancel():
+    """Cancel a queued job at once, or stop a running one (its worker picks it up within a second)."""
+    job_id = request.args.get("id")
+    j = jobs.get(job_id) if job_id else None
+    status = jobs.cancel(job_id, "Cancelled by the user.") if j else None
+    if status is None:
+        return jsonify({"status": "error", "message": "invalid id"}), 404
+    if status == "cancelled" and j.get("in"):
+        in_path = os.path.join(UPLOADS, j["in"])
+        if os.path.exists(in_path):
+            os.remove(in_path)
+        jobs.update(job_id, **{"in": None})
+    _notify_progress()
+    return jsonify({"id": job_id, "status": status})
+
+# --- batches: many documents per request, one job each, one ZIP of results ---
+def _zip_member_name(name):
+    # ZIP paths may be absolute or climb out with ".."; keep the safe relative part
+    parts = [p for p in name.replace("\\", "/").split("/") if p not in ("", ".", "..")]
+    if not parts or parts[0] == "__MACOSX":
+        return None
+    return "/".join(parts)
+
+def _batch_documents(files):
+    """
+    The PDFs of a /batch request as [(name, IngestFile)], PDFs inside ZIP files named by
+    their path in the ZIP and ingested member by member. Non-PDF members are skipped.
+    """
+    documents = []
+    unzipped_budget = BATCH_MAX_MB * 1024 * 1024
+
+    def add(name, pdf, src=None):
+        if len(documents) >= BATCH_MAX_FILES:
+            raise UploadRejected("at most %d documents per batch" % BATCH_MAX_FILES)
+        try:
+            if src is not None:
+                shutil.copyfileobj(src, pdf, 1024 * 1024)
+            documents.append((name, pdf.finish()))
+        except UploadRejected as e:
+            raise UploadRejected("%s: %s" % (name, e), e.status)
+
+    for f in files:
+        fname = os.path.basename(f.filename.replace("\\", "/"))
+        if allowed_pdf(fname):
+            add(fname, f.stream)
+        elif fname.lower().endswith(".zip"):
+            try:
+                with zipfile.ZipFile(f.stream) as zf:
+                    for info in zf.infolist():
+                        name = _zip_member_name(info.filename)
+                        if info.is_dir() or not name or not allowed_pdf(name):
+                            continue
+                        unzipped_budget -= info.file_size
+                        if BATCH_MAX_MB and unzipped_budget < 0:
+                            raise UploadRejected("batch is larger than %d MB unzipped" % BATCH_MAX_MB, 413)
+                        with zf.open(info) as src:
+                            add(name, _ingest_file(), src)
+            except (zipfile.BadZipFile, NotImplementedError, RuntimeError) as e:
+                # corrupt, encrypted or using an unsupported compression method
+                raise UploadRejected("%s: unreadable ZIP file (%s)" % (fname, e))
+        else:
+            raise UploadRejected("only pdf or zip files allowed: " + fname)
+    return documents
+
+def _batch_entry_names(members):
+    """job id -> DOCX name in the batch ZIP: the PDF's name with .docx, made unique."""
+    names, taken = {}, set()
+    for job_id, j in members:
+        base = os.path.splitext(j.get("name") or job_id)[0]
+        name, n = base + ".docx", 1
+        while name in taken:
+            n += 1
+            name = "%s (%d).docx" % (base, n)
+        taken.add(name)
+        names[job_id] = name
+    return names
+
+@app.route("/batch", methods=["POST"])
+def batch_upload():
+    """
+    Several PDFs (repeated "file" fields), ZIP files of PDFs, or both. Every document becomes
+    a job of the batch: /batch/status reports them together, /batch/download streams the results.
+    """
+    files = [f for f in request.files.getlist("file") if f.filename]
+    if not files:
+        return "no file", 400
+    options = _conversion_options(request.form)
+    invalid = _invalid_options(options)
+    if invalid:
+        return invalid, 400
+
+    janitor.start()
+    warm.start()
+    documents = _batch_documents(files)
+    if not documents:
+        return "no pdf found", 400
+
+    # unlike /upload, a batch owns its jobs: a PDF already being converted for someone
+    # else is converted again rather than attached (the result cache makes repeats cheap)
+    batch_id = str(uuid.uuid4())
+    members, queued = [], []
+    for name, pdf in documents:
+        job_id = pdf.name[:-len(".pdf")]
+        record = _new_job(job_id, pdf, options, batch=batch_id, name=name)
+        members.append({"id": job_id, "name": name, "cached": record["status"] == "done"})
+        if record["status"] == "queued":
+            queued.append((job_id, record, pdf))
+    try:
+        scheduler.submit_many([(job_id, record) for job_id, record, _ in queued])
+    except QueueFull as e:
+        for m in members:
+            jobs.pop(m["id"])
+        return _queue_full(e)
+    for _, _, pdf in queued:
+        pdf.kept = True
+    return jsonify({"id": batch_id, "jobs": members})
+
+@app.route("/batch/status")
+def batch_status():
+    batch_id = request.args.get("id")
+    members = jobs.batch(batch_id) if batch_id else []
+    if not members:
+        return jsonify({"status": "error", "message": "invalid id"}), 404
+    counts = {}
+    for _, j in members:
+        counts[j["status"]] = counts.get(j["status"], 0) + 1
+    finished = sum(counts.get(s, 0) for s in FINISHED)
+    if finished == len(members):
+        overall = "done"
+    elif counts.get("queued", 0) + counts.get("waiting", 0) == len(members):
+        overall = "queued"
+    else:
+        overall = "processing"
+    progress = sum(100 if j["status"] in FINISHED else j.get("progress") or 0 for _, j in members)
+    return jsonify({
+        "id": batch_id,
+        "status": overall,
+        "progress": int(progress / len(members)),
+        "total": len(members),
+        "finished": finished,
+        "counts": counts,
+        "jobs": [{"id": job_id, "name": j.get("name"), "status": j["status"], "progress": j.get("progress") or 0,
+                  "stage": j.get("stage"), "out": j.get("out"), "message": j.get("error")}
+                 for job_id, j in members],
+    })
+
+@app.route("/batch/download")
+def batch_download():
+    """
+    ZIP of the batch's DOCX files, streamed while the batch runs: each document is sent as
+    soon as its job finishes, and manifest.json (status of every document) closes the archive.
+    """
+    batch_id = request.args.get("id")
+    members = jobs.batch(batch_id) if batch_id else []
+    if not members:
+        return jsonify({"status": "error", "message": "invalid id"}), 404
+    entry_names = _batch_entry_names(members)
+
+    def stream():
+        archive = ZipStream()
+        pending = [job_id for job_id, _ in members]
+        manifest = {}
+        while pending:
+            for job_id in list(pending):
+                j = jobs.get(job_id)
+                if j is not None and j["status"] not in FINISHED:
+                    continue
+                pending.remove(job_id)
+                if j is None:
+                    manifest[job_id] = {"status": "error", "message": "job expired"}
+                    continue
+                entry = {"status": j["status"], "message": j.get("error")}
+                path = os.path.join(OUTPUTS, j["out"]) if j.get("out") else None
+                if j["status"] == "done" and path and os.path.exists(path):
+                    yield from archive.add_file(path, entry_names[job_id])
+                    entry["file"] = entry_names[job_id]
+                manifest[job_id] = entry
+            if pending:
+                with _progress_cond:
+                    _progress_cond.wait(1.0)
+        listing = [dict(manifest[job_id], id=job_id, name=j.get("name")) for job_id, j in members]
+        yield from archive.add_bytes("manifest.json", json.dumps(listing, indent=2).encode("utf-8"))
+        yield from archive.close()
+
+    return Response(stream(), mimetype="application/zip",
+                    headers={"Content-Disposition": 'attachment; filename="batch-%s.zip"' % batch_id[:8],
+                             "Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+@app.route("/metrics")
+def metrics_endpoint():
+    return metrics.registry.render(), 200, {"Content-Type": "text/plain; version=0.0.4"}
+
+@app.route("/download")
+def download():
+    fname = request.args.get("file")
+    if not fname:
+        return "missing file", 400
+    safe = os.path.basename(fname)
+    path = os.path.join(OUTPUTS, safe)
+    if not safe.lower().endswith(".docx") or not os.path.exists(path):
+        return "file not found", 404
+    # final validation: docx must be > 1 KB
+    if os.path.getsize(path) < 1024:
+        return "file corrupted or too small", 500
+    return send_output(safe)
+
+def send_output(name, download_name=None):
+    """
+    A DOCX from OUTPUTS as an attachment. Conditional (ETag / If-Modified-Since) and Range
+    requests are answered here, and the body goes out through the server's file wrapper
+    (sendfile) or, if configured, is handed to the front server.
+    """
+    if X_ACCEL_REDIRECT:
+        resp = Response(mimetype="application/vnd.openxmlformats-officedocument.wordprocessingml.document")
+        resp.headers["X-Accel-Redirect"] = X_ACCEL_REDIRECT.rstrip("/") + "/" + name
+        resp.headers.set("Content-Disposition", "attachment", filename=download_name or name)
+        return resp
+    return send_from_directory(OUTPUTS, name, as_attachment=True, download_name=download_name, conditional=True)
+
+def start_background(reloader=True):
+    """
+    Warm up and pick up jobs left queued by earlier or other processes, in the process that
+    serves requests only: under the debug reloader the parent just watches files and
+    restarts the child, and would otherwise run a second set of workers on JOB_DB.
+    """
+    if reloader and os.environ.get("WERKZEUG_RUN_MAIN") != "true":
+        return
+    warm.start()
+    scheduler.start()
+
+if __name__ == "__main__":
+    # helpful startup messages
+    print("Project root:", ROOT)
+    print("Uploads folder:", UPLOADS)
+    print("Outputs folder:", OUTPUTS)
+    print("Tools lookup:", TOOLS)
+    print("Tesseract path:", TESSERACT)
+    print("Poppler bin:", POPPLER_BIN)
+    print("Java exe:", JAVA_EXE)
+    print("Tabula jar:", TABULA_JAR)
+    print("Workers:", CONVERT_WORKERS, "queue max:", CONVERT_QUEUE_MAX, "executor:", CONVERT_EXECUTOR)
+    print("CPU budget:", CPU_BUDGET, "OCR threads per job:", OCR_THREADS_PER_JOB)
+    print("Job store:", JOB_DB)
+    if sys.argv[1:] == ["worker"]:
+        # conversion-only process: no HTTP, just claim jobs from the shared store
+        warm.start()
+        scheduler.start()
+        janitor.start()
+        while True:
+            time.sleep(3600)
+    start_background()
+    app.run(host="0.0.0.0", port=5000, debug=True)
@@ -0,0 +1,319 @@
+"""
+Conversion benchmark on a synthetic PDF corpus.
+
+    python benchmark.py                              # generate corpus (once) and run everything
+    python benchmark.py --paths all_in_one --kinds text,scanned --sizes 1,10 --repeat 3
+    python benchmark.py --out bench/baseline.json    # store a baseline
+    python benchmark.py --compare bench/baseline.json  # exit 1 on regressions
+
+The corpus is generated offline with PyMuPDF from fixed seeds, so every machine builds the
+same files. Every run converts in a fresh process: peak RSS is that run's alone and module
+imports are not counted in the latency.
+"""
+import argparse
+import json
+import math
+import multiprocessing
+import os
+import platform
+import random
+import subprocess
+import sys
+import time
+
+try:
+    import resource
+except ImportError:      # Windows
+    resource = None
+
+BENCH_DIR = os.environ.get("BENCH_DIR") or os.path.join("bench")
+KINDS = ("text", "scanned", "mixed", "tables")
+SIZES = (1, 10, 100, 500)
+# conversion path -> "module:function" called as function(pdf_path, out_docx)
+PATHS = {
+    "all_in_one": "convert_all_in_one:convert_pdf_to_docx",
+    "fallback": "conversion:fallback_convert",
+    "pdf2docx": "benchmark:_layout_only",
+    "fast": "benchmark:_fast_only",
+}
+# relative change that counts as a regression in --compare
+TOLERANCE = 0.10
+
+WORDS = ("invoice report quarterly revenue margin customer account balance total payment "
+         "service delivery contract period summary region product volume growth forecast "
+         "analysis statement operating review budget schedule").split()
+
+
+# --- Corpus ---
+def _sentence(rng, n=12):
+    words = [rng.choice(WORDS) for _ in range(n)]
+    return " ".join(words).capitalize() + "."
+
+
+def _text_page(doc, rng):
+    page = doc.new_page()
+    page.insert_text((72, 80), _sentence(rng, 5).rstrip(".").title(), fontsize=16)
+    y = 110
+    while y < 760:
+        page.insert_text((72, y), _sentence(rng, 11), fontsize=10)
+        y += 14
+    return page
+
+
+def _scanned_page(doc, rng):
+    # a text page rasterized to a grayscale image, like a scanner would produce
+    import fitz
+    src = fitz.open()
+    _text_page(src, rng)
+    pix = src[0].get_pixmap(dpi=150, colorspace=fitz.csGRAY)
+    src.close()
+    page = doc.new_page()
+    page.insert_image(page.rect, pixmap=pix)
+    return page
+
+
+def _table_page(doc, rng, rows=20, cols=5):
+    page = doc.new_page()
+    page.insert_text((72, 70), _sentence(rng, 6), fontsize=12)
+    x0, y0, w, h = 72, 90, 90, 22
+    for r in range(rows + 1):
+        page.draw_line((x0, y0 + r * h), (x0 + cols * w, y0 + r * h))
+    for c in range(cols + 1):
+        page.draw_line((x0 + c * w, y0), (x0 + c * w, y0 + rows * h))
+    for r in range(rows):
+        for c in range(cols):
+            cell = rng.choice(WORDS) if r == 0 or c == 0 else "%.2f" % rng.uniform(0, 10000)
+            page.insert_text((x0 + c * w + 4, y0 + r * h + 15), cell, fontsize=9)
+    return page
+
+
+_MAKERS = {"text": _text_page, "scanned": _scanned_page, "tables": _table_page}
+
+
+def corpus_file(kind, pages, directory=None):
+    return os.path.join(directory or os.path.join(BENCH_DIR, "corpus"), "%s-%dp.pdf" % (kind, pages))
+
+
+def generate_corpus(kinds=KINDS, sizes=SIZES, directory=None):
+    """Write the corpus PDFs that do not exist yet; returns their paths."""
+    import fitz
+    paths = []
+    for kind in kinds:
+        for pages in sizes:
+            path = corpus_file(kind, pages, directory)
+            paths.append(path)
+            if os.path.exists(path):
+                continue
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            rng = random.Random("%s-%d" % (kind, pages))
+            doc = fitz.open()
+            for n in range(pages):
+                if kind == "mixed":
+                    _MAKERS[("text", "scanned", "tables")[n % 3]](doc, rng)
+                else:
+                    _MAKERS[kind](doc, rng)
+            doc.save(path, garbage=3, deflate=True)
+            doc.close()
+            print("generated", path)
+    return paths
+
+
+# --- Running ---
+def _layout_only(pdf_path, out_docx):
+    # the convert.py path: pdf2docx layout only
+    from pdf_layout import layout_document
+    doc = layout_document(pdf_path)
+    if doc is None:
+        return False
+    doc.save(out_docx)
+    return True
+
+
+def _fast_only(pdf_path, out_docx):
+    # convert.py --mode fast: text layer only
+    from fast_docx import build_document
+    build_document(pdf_path).save(out_docx)
+    return True
+
+
+def _peak_rss_mb():
+    # ru_maxrss is in KB; Windows has no resource module, but psutil reports the peak working set
+    if resource is not None:
+        return max(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+                   resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss) / 1024.0
+    try:
+        import psutil
+        info = psutil.Process().memory_info()
+        return getattr(info, "peak_wset", info.rss) / (1024.0 * 1024.0)
+    except Exception:
+        return 0.0
+
+
+def _run_once(target, pdf_path, out_docx):
+    """Runs in a fresh process: convert once, return timing, peak memory and stage spans."""
+    import metrics
+    from workers import _resolve
+    func = _resolve(target)
+    metrics.begin_trace()
+    t0 = time.perf_counter()
+    error = None
+    try:
+        ok = func(pdf_path, out_docx)
+        if ok is False:
+            error = "conversion returned False"
+    except Exception as e:
+        error = "%s: %s" % (type(e).__name__, e)
+    seconds = time.perf_counter() - t0
+    peak = _peak_rss_mb()
+    size = os.path.getsize(out_docx) if os.path.exists(out_docx) else 0
+    return {"seconds": seconds, "peak_rss_mb": peak, "output_bytes": size,
+            "error": error, "stages": metrics.end_trace()}
+
+
+def _percentile(values, q):
+    # nearest rank; repeats are few, so no interpolation
+    values = sorted(values)
+    return values[max(0, math.ceil(q * len(values)) - 1)]
+
+
+def bench_one(path_name, pdf_path, pages, repeat, ctx):
+    out_dir = os.path.join(BENCH_DIR, "out")
+    os.makedirs(out_dir, exist_ok=True)
+    out_docx = os.path.join(out_dir, "%s-%s.docx" % (path_name, os.path.splitext(os.path.basename(pdf_path))[0]))
+    runs = []
+    for _ in range(repeat):
+        if os.path.exists(out_docx):
+            os.remove(out_docx)
+        with ctx.Pool(1, maxtasksperchild=1) as pool:
+            runs.append(pool.apply(_run_once, (PATHS[path_name], pdf_path, out_docx)))
+
+    ok = [r for r in runs if not r["error"]]
+    result = {
+        "path": path_name,
+        "corpus": os.path.basename(pdf_path),
+        "pages": pages,
+        "runs": len(runs),
+        "errors": sorted({r["error"] for r in runs if r["error"]}),
+    }
+    if ok:
+        seconds = [r["seconds"] for r in ok]
+        p50 = _percentile(seconds, 0.5)
+        stages = {}
+        for r in ok:
+            for span in r["stages"]:
+                stages.setdefault(span["stage"], []).append(span["wall_s"])
+        result.update({
+            "pages_per_sec": round(pages / p50, 3) if p50 else None,
+            "p50_s": round(p50, 3),
+            "p95_s": round(_percentile(seconds, 0.95), 3),
+            "peak_rss_mb": round(max(r["peak_rss_mb"] for r in ok), 1),
+            "output_bytes": max(r["output_bytes"] for r in ok),
+            "stages_p50_s": {name: round(_percentile(v, 0.5), 3) for name, v in sorted(stages.items())},
+        })
+    return result
+
+
+def _git_commit():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], stderr=subprocess.DEVNULL).decode().strip()
+    except Exception:
+        return None
+
+
+def run_benchmark(paths, kinds, sizes, repeat=3):
+    generate_corpus(kinds, sizes)
+    # spawn: every run starts from a clean interpreter, like a converter worker does
+    ctx = multiprocessing.get_context("spawn")
+    results = []
+    for path_name in paths:
+        for kind in kinds:
+            for pages in sizes:
+                r = bench_one(path_name, corpus_file(kind, pages), pages, repeat, ctx)
+                r["kind"] = kind
+                results.append(r)
+                if r["errors"]:
+                    print("%-10s %-18s errors: %s" % (path_name, r["corpus"], "; ".join(r["errors"])))
+                if "p50_s" in r:
+                    print("%-10s %-18s %8.2f pages/s  p50 %7.2fs  p95 %7.2fs  rss %7.1f MB  %9d bytes" % (
+                        path_name, r["corpus"], r["pages_per_sec"], r["p50_s"], r["p95_s"],
+                        r["peak_rss_mb"], r["output_bytes"]))
+    return {
+        "meta": {
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "commit": _git_commit(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "repeat": repeat,
+        },
+        "results": results,
+    }
+
+
+# --- Compare ---
+def compare(report, baseline, tolerance=TOLERANCE):
+    """
+    Regressions of `report` against `baseline` for each (path, corpus) present in both:
+    throughput down, or p95 latency / peak RSS / output size up, by more than `tolerance`.
+    A case that worked in the baseline and now fails is always a regression.
+    """
+    base = {(r["path"], r["corpus"]): r for r in baseline["results"]}
+    regressions = []
+    for r in report["results"]:
+        b = base.get((r["path"], r["corpus"]))
+        if b is None or "p50_s" not in b:
+            continue
+        case = "%s %s" % (r["path"], r["corpus"])
+        if "p50_s" not in r:
+            regressions.append("%s: now fails (%s)" % (case, "; ".join(r["errors"])))
+            continue
+        if r["pages_per_sec"] < b["pages_per_sec"] * (1 - tolerance):
+            regressions.append("%s: pages/sec %.2f -> %.2f" % (case, b["pages_per_sec"], r["pages_per_sec"]))
+        for key, unit in (("p95_s", "s"), ("peak_rss_mb", " MB"), ("output_bytes", " bytes")):
+            if r[key] > b[key] * (1 + tolerance):
+                regressions.append("%s: %s %s%s -> %s%s" % (case, key, b[key], unit, r[key], unit))
+    return regressions
+
+
+def _csv(value, cast=str):
+    return [cast(v) for v in value.split(",") if v.strip()]
+
+
+if __name__ == "__main__":
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    ap = argparse.ArgumentParser(description="Benchmark PDF -> DOCX conversion on a synthetic corpus")
+    ap.add_argument("--paths", default=",".join(PATHS), help="Conversion paths: " + ", ".join(PATHS))
+    ap.add_argument("--kinds", default=",".join(KINDS), help="Corpus kinds: " + ", ".join(KINDS))
+    ap.add_argument("--sizes", default=",".join(map(str, SIZES)), help="Page counts")
+    ap.add_argument("--repeat", type=int, default=3, help="Runs per case")
+    ap.add_argument("--out", help="Write the JSON report here (default: stdout)")
+    ap.add_argument("--compare", metavar="BASELINE", help="Baseline report to check for regressions")
+    ap.add_argument("--tolerance", type=float, default=TOLERANCE, help="Allowed relative change")
+    ap.add_argument("--generate-only", action="store_true", help="Only build the corpus")
+    args = ap.parse_args()
+
+    kinds, sizes = _csv(args.kinds), _csv(args.sizes, int)
+    if args.generate_only:
+        generate_corpus(kinds, sizes)
+        sys.exit(0)
+
+    unknown = [p for p in _csv(args.paths) if p not in PATHS]
+    if unknown:
+        ap.error("unknown path(s): " + ", ".join(unknown))
+    report = run_benchmark(_csv(args.paths), kinds, sizes, args.repeat)
+
+    if args.out:
+        os.makedirs(os.path.dirname(args.out) or ".", exist_ok=True)
+        with open(args.out, "w") as f:
+            json.dump(report, f, indent=2)
+        print("report written to", args.out)
+    else:
+        print(json.dumps(report, indent=2))
+
+    if args.compare:
+        with open(args.compare) as f:
+            regressions = compare(report, json.load(f), args.tolerance)
+        for line in regressions:
+            print("REGRESSION", line)
+        print("%d regression(s) against %s" % (len(regressions), args.compare))
+        sys.exit(1 if regressions else 0)
@@ -0,0 +1,327 @@
+"""
+The conversion a job runs: convert_all_in_one when it can be imported, the pdf2docx +
+tesseract fallback otherwise, then the DOCX image pass. Converter processes (workers.py)
+call it through _traced_call. Importing this module creates no folders or stores, so
+they and benchmark.py never load the web app.
+"""
+import os
+import queue
+import threading
+
+import metrics
+from metrics import stage
+from ocr_cache import PageOCRCache, page_key
+from ocr_engine import BatchOCR
+
+ROOT = os.path.abspath(os.getcwd())
+TOOLS = os.path.join(ROOT, "tools")
+
+# Tool default paths (will be used by convert function)
+TESSERACT = os.environ.get("TESSERACT_PATH") or os.path.join(TOOLS, "tesseract", "tesseract.exe")
+POPPLER_BIN = os.environ.get("POPPLER_PATH") or os.path.join(TOOLS, "poppler", "bin")
+JAVA_EXE = os.environ.get("JAVA_PATH") or os.path.join(TOOLS, "java", "bin", "java.exe")
+TABULA_JAR = os.environ.get("TABULA_JAR") or os.path.join(TOOLS, "tabula", "tabula.jar")
+
+# At most CONVERT_WORKERS conversions run at once (app.py's worker pool); CPU_BUDGET is the
+# total CPU threads they may use, and each running job gets an equal share for OCR
+CONVERT_WORKERS = int(os.environ.get("CONVERT_WORKERS") or min(2, os.cpu_count() or 1))
+CPU_BUDGET = int(os.environ.get("CPU_BUDGET") or os.cpu_count() or 1)
+OCR_THREADS_PER_JOB = max(1, CPU_BUDGET // max(1, CONVERT_WORKERS))
+# the same share bounds a job's pdf2docx layout chunk processes (pdf_layout, also in
+# converter processes, which inherit the environment)
+LAYOUT_JOBS = int(os.environ.setdefault("LAYOUT_JOBS", str(OCR_THREADS_PER_JOB)) or 1)
+
+# OCR fallback rasterizes OCR_WINDOW pages at a time instead of the whole document
+OCR_DPI = int(os.environ.get("OCR_DPI") or 300)
+OCR_WINDOW = int(os.environ.get("OCR_WINDOW") or 4)
+
+# OCR text of rasterized pages is reused for identical page bitmaps: the last
+# OCR_CACHE_ENTRIES pages in memory, up to OCR_CACHE_MB on disk under output/.ocr-cache
+OCR_CACHE_ENTRIES = int(os.environ.get("OCR_CACHE_ENTRIES") or 512)
+OCR_CACHE_MB = int(os.environ.get("OCR_CACHE_MB") or 256)
+
+# the OCR fallback hands tesseract OCR_BATCH_PAGES pages per process, running
+# OCR_THREADS_PER_JOB such processes per job (CPU_BUDGET of them per process overall)
+OCR_BATCH_PAGES = int(os.environ.get("OCR_BATCH_PAGES") or 8)
+# The user's convert_all_in_one.convert_pdf_to_docx, if present. It pulls in pdfplumber,
+# tabula and python-docx, so it is imported on first use (or by the warm-up), not at startup
+_NOT_LOADED = object()
+_convert_func = _NOT_LOADED
+_convert_func_lock = threading.Lock()
+
+def load_converter():
+    """convert_all_in_one.convert_pdf_to_docx, or None when it cannot be imported."""
+    global _convert_func
+    with _convert_func_lock:
+        if _convert_func is _NOT_LOADED:
+            try:
+                import convert_all_in_one as converter_module
+                _convert_func = getattr(converter_module, "convert_pdf_to_docx", None)
+            except Exception as e:
+                print("convert_all_in_one not available, using the fallback:", e)
+                _convert_func = None
+        return _convert_func
+
+def converter_loaded():
+    """Whether load_converter() found convert_all_in_one in this process; None before it ran."""
+    if _convert_func is _NOT_LOADED:
+        return None
+    return _convert_func is not None
+
+ocr_cache = PageOCRCache(os.path.join(ROOT, "output", ".ocr-cache"), OCR_CACHE_ENTRIES, OCR_CACHE_MB * 1024 * 1024)
+
+def ocr_page_texts(pdf_path, pages=None, span=None, progress_callback=None):
+    """
+    {page: tesseract text} for `pages` (1-based) or every page. A page whose bitmap was
+    OCRed before comes from the page OCR cache; the rest are OCRed in batches.
+    """
+    import tempfile
+    texts, keys, seen = {}, {}, [0]
+    queued = {}   # key -> first page of this document sent to tesseract with that bitmap
+
+    def _report(batched):
+        if progress_callback:
+            progress_callback("ocr", len(texts) + batched, len(pages) if pages else seen[0])
+
+    # leaving early (e.g. JobStopped from progress_callback) kills the tesseract runs
+    with tempfile.TemporaryDirectory() as td, \
+            BatchOCR(td, batch_size=OCR_BATCH_PAGES, jobs=OCR_THREADS_PER_JOB,
+                     cmd=TESSERACT if os.path.exists(TESSERACT) else None, on_page=_report) as batch:
+        for n, img in iter_page_images(pdf_path, pages=pages):
+            seen[0] += 1
+            key = page_key(img) if ocr_cache.enabled else None
+            text = ocr_cache.get(key) if key and key not in queued else None
+            if span is not None and key:
+                field = "ocr_cache_misses" if text is None and key not in queued else "ocr_cache_hits"
+                span[field] = span.get(field, 0) + 1
+            if key in queued:
+                keys[n] = key      # same bitmap as an earlier page: reuse its text
+            elif text is None:
+                keys[n] = key
+                if key:
+                    queued[key] = n
+                batch.add(n, img)
+            else:
+                texts[n] = text
+                _report(len(batch.texts))
+            img.close()
+        ocr = batch.finish()
+    for key, first in queued.items():
+        ocr_cache.put(key, ocr[first])
+    for n, key in keys.items():
+        texts[n] = ocr[queued[key]] if key else ocr[n]
+    if keys:
+        _report(0)
+    return texts
+
+def iter_page_images(pdf_path, pages=None, dpi=OCR_DPI, window=OCR_WINDOW):
+    """
+    Yield (page_number, PIL image) in page order, for `pages` (1-based) or every page.
+    A background thread rasterizes up to `window` consecutive pages per poppler call, so OCR
+    can start on the first page while later ones render, and at most ~2 windows of bitmaps
+    are alive at once.
+    """
+    from pdf2image import convert_from_path, pdfinfo_from_path
+    poppler = POPPLER_BIN if os.path.exists(POPPLER_BIN) else None
+    if pages is None:
+        pages = range(1, int(pdfinfo_from_path(pdf_path, poppler_path=poppler)["Pages"]) + 1)
+
+    # consecutive runs of wanted pages, each at most `window` long
+    runs = []
+    for n in sorted(pages):
+        if runs and n == runs[-1][1] + 1 and n - runs[-1][0] < window:
+            runs[-1][1] = n
+        else:
+            runs.append([n, n])
+
+    rendered = queue.Queue(maxsize=max(1, window))
+    stop = threading.Event()
+
+    def _put(item):
+        while not stop.is_set():
+            try:
+                rendered.put(item, timeout=0.5)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def _render():
+        try:
+            for first, last in runs:
+                imgs = convert_from_path(pdf_path, dpi=dpi, first_page=first, last_page=last, poppler_path=poppler)
+                for n, img in enumerate(imgs, start=first):
+                    if not _put((n, img)):
+                        return
+                del imgs
+        except Exception as e:
+            _put(e)
+        finally:
+            _put(None)
+
+    t = threading.Thread(target=_render, name="rasterize", daemon=True)
+    t.start()
+    try:
+        while True:
+            item = rendered.get()
+            if item is None:
+                break
+            if isinstance(item, Exception):
+                raise item
+            yield item
+    finally:
+        # consumer stopped early: unblock the renderer and drop anything it queued
+        stop.set()
+        while not rendered.empty():
+            rendered.get_nowait()
+        t.join()
+
+# If convert_all_in_one not present, we'll implement a minimal fallback using pdf2docx + OCR
+def _fast_convert(pdf_path, out_docx, progress_callback=None):
+    """Fast mode without ocrmypdf: tesseract text for scanned pages, text layer for the rest."""
+    import fast_docx
+    with stage("fallback.page_index"):
+        ocr_pages = fast_docx.scanned_pages(pdf_path)
+    ocr_text = {}
+    with stage("fallback.ocr", pages=len(ocr_pages) or None) as span:
+        if ocr_pages:
+            ocr_text = ocr_page_texts(pdf_path, ocr_pages, span, progress_callback)
+    with stage("fallback.text"):
+        doc = fast_docx.build_document(pdf_path, ocr_text=ocr_text, progress=progress_callback)
+    with stage("fallback.save"):
+        doc.save(out_docx)
+    return True
+
+def fallback_convert(pdf_path, out_docx, progress_callback=None, mode="layout"):
+    """
+    Simple fallback conversion:
+     - pdf2docx for pages with a text layer
+     - poppler rasterization + tesseract OCR for scanned pages
+     - both merged into one document in page order
+    This is intentionally conservative and intended as a working fallback.
+    """
+    from pdf2docx import Converter as PDF2DOCX
+    from docx import Document
+    if mode == "fast":
+        return _fast_convert(pdf_path, out_docx, progress_callback)
+
+    # per-page text/scan index (shared with convert_all_in_one through its memo)
+    with stage("fallback.page_index") as span:
+        try:
+            from page_index import build_page_index
+            index = build_page_index(pdf_path)
+        except Exception:
+            index = []
+        span["pages"] = len(index)
+    layout_pages = [p["page"] for p in index if not p["scanned"]]
+
+    # If every page has selectable text, pdf2docx does the whole document
+    if index and len(layout_pages) == len(index):
+        try:
+            from pdf_layout import layout_document
+            with stage("fallback.layout", pages=len(index)):
+                doc = layout_document(pdf_path, progress=progress_callback)
+            if doc is not None:
+                with stage("fallback.save"):
+                    doc.save(out_docx)
+                return True
+        except Exception:
+            pass
+        layout_pages = []
+
+    # otherwise lay out the text pages and OCR only the rest
+    cv = None
+    if layout_pages:
+        try:
+            with stage("fallback.layout", pages=len(layout_pages)):
+                from pdf_layout import parse_pages
+                cv = PDF2DOCX(pdf_path)
+                parse_pages(cv, cv.default_settings, pages=[n - 1 for n in layout_pages], progress=progress_callback)
+        except Exception:
+            cv, layout_pages = None, []
+    laid_out = set(layout_pages)
+    ocr_pages = [p["page"] for p in index if p["page"] not in laid_out] if index else None
+
+    doc = Document()
+
+    def _add_layout_pages(before):
+        while layout_pages and layout_pages[0] < before:
+            page = cv.pages[layout_pages.pop(0) - 1]
+            try:
+                page.make_docx(doc)
+            except Exception as e:
+                print("layout page", page.id + 1, "skipped:", e)
+
+    # OCR (high-DPI) in batched tesseract runs; only the text of each page is kept
+    with stage("fallback.ocr") as span:
+        ocr_text = ocr_page_texts(pdf_path, ocr_pages, span, progress_callback)
+        span["pages"] = len(ocr_text)
+    for n in sorted(ocr_text):
+        _add_layout_pages(n)
+        if doc.paragraphs:
+            doc.add_page_break()
+        for line in ocr_text[n].splitlines():
+            if line.strip():
+                doc.add_paragraph(line)
+    _add_layout_pages(float("inf"))
+    if cv is not None:
+        cv.close()
+
+    with stage("fallback.save"):
+        doc.save(out_docx)
+    return True
+
+# use selected conversion function (user-provided or fallback)
+def run_conversion(pdf_path, out_docx, progress_callback=None, options=None):
+    options = options or {}
+    # prefer user convert_func if available
+    convert_func = load_converter()
+    if convert_func:
+        # try calling user implementation; many user scripts accept (pdf_path, out_docx)
+        try:
+            # If convert_func uses tools relative to project root, ensure current env knows them
+            os.environ["TESSERACT_PATH"] = TESSERACT
+            os.environ["POPPLER_PATH"] = POPPLER_BIN
+            os.environ["JAVA_PATH"] = JAVA_EXE
+            os.environ["TABULA_JAR"] = TABULA_JAR
+            return bool(convert_func(pdf_path, out_docx, ocr_profile=options.get("ocr_profile"),
+                                     ocr_jobs=OCR_THREADS_PER_JOB, progress=progress_callback,
+                                     mode=options.get("mode", "layout")))
+        except Exception as e:
+            # fallback on error
+            print("convert_all_in_one failed:", e)
+            return fallback_convert(pdf_path, out_docx, progress_callback, mode=options.get("mode", "layout"))
+    else:
+        return fallback_convert(pdf_path, out_docx, progress_callback, mode=options.get("mode", "layout"))
+
+def optimize_output(out_docx, progress_callback=None):
+    """Downsample / recompress the images of a finished DOCX; the span records the size change."""
+    from docx_optimize import IMAGE_DPI, optimize_docx
+    if not IMAGE_DPI:
+        return None
+    with stage("optimize") as span:
+        span.update(optimize_docx(out_docx))
+    return span["bytes_after"]
+
+def _traced_call(func_name, with_progress, args, kwargs, tmpdir=None):
+    """
+    Runs inside a converter process: call the function and ship its stage spans back.
+    Temp files (ours, ocrmypdf's, tabula's) go to tmpdir, so they can be removed even if
+    the process is killed before its TemporaryDirectory contexts clean up.
+    """
+    import tempfile
+    from workers import report_progress
+    if tmpdir:
+        tempfile.tempdir = os.environ["TMPDIR"] = tmpdir
+    # a converter process runs one job at a time: its CPU time and memory are this job's
+    metrics.begin_trace(scope="job")
+    try:
+        progress = report_progress if with_progress else None
+        return globals()[func_name](*args, progress_callback=progress, **kwargs), metrics.end_trace()
+    except Exception:
+        metrics.end_trace()
+        raise
+    finally:
+        if tmpdir:
+            tempfile.tempdir = None
+            os.environ.pop("TMPDIR", None)
@@ -1,28 +1,209 @@
+import argparse
+import json
+import multiprocessing
 import os
-from pdf2docx import Converter
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from result_cache import file_sha256
 
 INPUT_DIR = "input"
 OUTPUT_DIR = "output"
+MANIFEST_NAME = ".manifest.jsonl"
+ENGINES = ("pdf2docx", "all_in_one")
+MODES = ("layout", "fast")
 
-os.makedirs(INPUT_DIR, exist_ok=True)
-os.makedirs(OUTPUT_DIR, exist_ok=True)
-
-pdfs = [f for f in os.listdir(INPUT_DIR) if f.lower().endswith(".pdf")]
 
-if not pdfs:
-    print("⚠️ No PDFs found in input/. Nothing to convert.")
-    exit(0)
+# --- Worker side (runs in the batch pool) ---
+def _init_worker(ocr_jobs):
+    # files are the unit of parallelism here: keep each conversion to one core's worth
+    import pdf_layout
+    pdf_layout.LAYOUT_JOBS = 1
+    if ocr_jobs:
+        import convert_all_in_one
+        convert_all_in_one.OCR_JOBS = ocr_jobs
 
-for filename in pdfs:
-    pdf_path = os.path.join(INPUT_DIR, filename)
-    docx_name = os.path.splitext(filename)[0] + ".docx"
-    docx_path = os.path.join(OUTPUT_DIR, docx_name)
 
-    print(f"Converting {pdf_path} → {docx_path}")
+def convert_one(pdf_path, docx_path, options):
+    """Convert one PDF with the engine named in options; returns {"pages", "seconds"}."""
+    import fitz
+    t0 = time.perf_counter()
+    with fitz.open(pdf_path) as pdf:
+        pages = pdf.page_count
+    # written next to the target and renamed, so an interrupted run never leaves a half DOCX
+    part = docx_path + ".part"
     try:
-        cv = Converter(pdf_path)
-        cv.convert(docx_path, start=0, end=None)
-        cv.close()
-        print(f"✅ Saved {docx_path}")
-    except Exception as e:
-        print(f"❌ Failed to convert {filename}: {e}")
+        if options["engine"] == "all_in_one":
+            from convert_all_in_one import convert_pdf_to_docx
+            if not convert_pdf_to_docx(pdf_path, part, ocr_profile=options.get("profile"),
+                                       mode=options.get("mode", "layout")):
+                raise RuntimeError("convert_all_in_one failed")
+        elif options.get("mode") == "fast":
+            from fast_docx import build_document
+            build_document(pdf_path).save(part)
+        else:
+            from pdf_layout import layout_document
+            doc = layout_document(pdf_path)
+            if doc is None:
+                raise RuntimeError("no pages could be converted")
+            doc.save(part)
+        from docx_optimize import IMAGE_DPI, optimize_docx
+        if IMAGE_DPI:
+            optimize_docx(part)
+        os.replace(part, docx_path)
+    finally:
+        if os.path.exists(part):
+            os.remove(part)
+    return {"pages": pages, "seconds": round(time.perf_counter() - t0, 3)}
+
+
+# --- Manifest ---
+def load_manifest(path):
+    """Latest record per input from the append-only manifest (a torn last line is ignored)."""
+    entries = {}
+    if not os.path.exists(path):
+        return entries
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            try:
+                rec = json.loads(line)
+            except ValueError:
+                continue
+            entries[rec["input"]] = rec
+    return entries
+
+
+def compact_manifest(path, entries):
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        for rec in sorted(entries.values(), key=lambda r: r["input"]):
+            f.write(json.dumps(rec, sort_keys=True) + "\n")
+    os.replace(tmp, path)
+
+
+def _find_pdfs(input_dir):
+    for root, dirs, files in os.walk(input_dir):
+        dirs.sort()
+        for name in sorted(files):
+            if name.lower().endswith(".pdf"):
+                yield os.path.relpath(os.path.join(root, name), input_dir)
+
+
+def _content_hash(path, previous):
+    # an untouched file (same size and mtime) keeps the hash recorded last time
+    st = os.stat(path)
+    if previous and previous.get("size") == st.st_size and previous.get("mtime_ns") == st.st_mtime_ns:
+        return previous["sha256"], st
+    return file_sha256(path), st
+
+
+def run_batch(input_dir=INPUT_DIR, output_dir=OUTPUT_DIR, jobs=1, options=None, force=False):
+    """
+    Convert every PDF under input_dir into the same relative path under output_dir.
+    Each finished file is appended to output_dir/.manifest.jsonl with its content hash,
+    options and result; files whose hash and options match a successful record (and whose
+    DOCX still exists) are skipped, so re-running after an interruption resumes the batch.
+    """
+    options = options or {"engine": "pdf2docx"}
+    os.makedirs(input_dir, exist_ok=True)
+    os.makedirs(output_dir, exist_ok=True)
+    manifest_path = os.path.join(output_dir, MANIFEST_NAME)
+    manifest = load_manifest(manifest_path)
+
+    todo, skipped = [], 0
+    for rel in _find_pdfs(input_dir):
+        pdf_path = os.path.join(input_dir, rel)
+        docx_path = os.path.join(output_dir, os.path.splitext(rel)[0] + ".docx")
+        prev = manifest.get(rel)
+        sha, st = _content_hash(pdf_path, prev)
+        if (not force and prev and prev["status"] == "done" and prev["sha256"] == sha
+                and prev["options"] == options and os.path.exists(docx_path)):
+            skipped += 1
+            continue
+        base = {"input": rel, "output": os.path.relpath(docx_path, output_dir), "sha256": sha,
+                "size": st.st_size, "mtime_ns": st.st_mtime_ns, "options": options}
+        todo.append((pdf_path, docx_path, base))
+
+    if not todo and not skipped:
+        print(f"⚠️ No PDFs found in {input_dir}/. Nothing to convert.")
+        return {"converted": 0, "skipped": 0, "failed": []}
+
+    print(f"{len(todo)} to convert, {skipped} unchanged, {jobs} job(s), engine {options['engine']}")
+    t0 = time.perf_counter()
+    converted, pages, failed = 0, 0, []
+    with open(manifest_path, "a", encoding="utf-8") as log:
+        def record(base, result=None, error=None):
+            nonlocal converted, pages
+            rec = dict(base, finished=time.strftime("%Y-%m-%dT%H:%M:%S"))
+            if error is None:
+                rec.update(status="done", **result)
+                converted += 1
+                pages += result["pages"]
+                print(f"✅ {base['input']} ({result['pages']} pages, {result['seconds']}s)")
+            else:
+                rec.update(status="failed", error=error)
+                failed.append((base["input"], error))
+                print(f"❌ Failed to convert {base['input']}: {error}")
+            manifest[base["input"]] = rec
+            log.write(json.dumps(rec, sort_keys=True) + "\n")
+            log.flush()
+
+        for _, docx_path, _ in todo:
+            os.makedirs(os.path.dirname(docx_path), exist_ok=True)
+
+        if jobs <= 1:
+            for pdf_path, docx_path, base in todo:
+                try:
+                    record(base, convert_one(pdf_path, docx_path, options))
+                except Exception as e:
+                    record(base, error=str(e))
+        else:
+            ocr_jobs = max(1, (os.cpu_count() or 1) // jobs) if options["engine"] == "all_in_one" else None
+            with ProcessPoolExecutor(max_workers=jobs, mp_context=multiprocessing.get_context("spawn"),
+                                     initializer=_init_worker, initargs=(ocr_jobs,)) as pool:
+                futures = {pool.submit(convert_one, pdf_path, docx_path, options): base
+                           for pdf_path, docx_path, base in todo}
+                for fut in as_completed(futures):
+                    try:
+                        record(futures[fut], fut.result())
+                    except Exception as e:
+                        record(futures[fut], error=str(e) or type(e).__name__)
+
+    compact_manifest(manifest_path, manifest)
+    elapsed = time.perf_counter() - t0
+    print(f"\nConverted {converted}, skipped {skipped}, failed {len(failed)} in {elapsed:.1f}s"
+          f" ({converted / elapsed if elapsed else 0:.2f} files/s, {pages / elapsed if elapsed else 0:.2f} pages/s)")
+    for rel, error in failed:
+        print(f"  ❌ {rel}: {error}")
+    return {"converted": converted, "skipped": skipped, "failed": failed, "pages": pages, "seconds": elapsed}
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Convert every PDF in a folder to DOCX")
+    ap.add_argument("--input", default=INPUT_DIR, help="Folder with PDFs (searched recursively)")
+    ap.add_argument("--output", default=OUTPUT_DIR, help="Folder for DOCX files and the manifest")
+    ap.add_argument("--jobs", type=int, default=1, help="Files converted in parallel")
+    ap.add_argument("--engine", choices=ENGINES, default="pdf2docx",
+                    help="pdf2docx layout only, or the convert_all_in_one pipeline (OCR + tables)")
+    ap.add_argument("--profile", default=None, help="OCR profile for --engine all_in_one")
+    ap.add_argument("--mode", choices=MODES, default="layout",
+                    help="fast: text, headings and page breaks only, without layout analysis or tables")
+    ap.add_argument("--force", action="store_true", help="Convert even files the manifest marks up to date")
+    args = ap.parse_args()
+
+    options = {"engine": args.engine}
+    if args.engine == "all_in_one":
+        from convert_all_in_one import DEFAULT_OCR_PROFILE, OCR_PROFILES
+        if args.profile and args.profile not in OCR_PROFILES:
+            ap.error("unknown OCR profile: " + args.profile)
+        options["profile"] = args.profile or DEFAULT_OCR_PROFILE
+    if args.mode != "layout":
+        # only recorded when set, so manifests of earlier layout runs still match
+        options["mode"] = args.mode
+    summary = run_batch(args.input, args.output, max(1, args.jobs), options, args.force)
+    raise SystemExit(1 if summary["failed"] else 0)
+
+
+# guarded: batch and layout worker processes are spawned and re-import this module
+if __name__ == "__main__":
+    main()
@@ -1,138 +1,268 @@
-import os
-import sys
-import tempfile
-import subprocess
-from pathlib import Path
-import pdfplumber
-import tabula
-from docx import Document
-
-# === Tools ===
-ROOT = os.path.abspath(os.getcwd())
-TOOLS = os.path.join(ROOT, "tools")
-
-TESSERACT = os.environ.get("TESSERACT_PATH") or os.path.join(TOOLS, "tesseract", "tesseract.exe")
-POPPLER_BIN = os.environ.get("POPPLER_PATH") or os.path.join(TOOLS, "poppler", "bin")
-JAVA_EXE = os.environ.get("JAVA_PATH") or os.path.join(TOOLS, "java", "bin", "java.exe")
-TABULA_JAR = os.environ.get("TABULA_JAR") or os.path.join(TOOLS, "tabula", "tabula.jar")
-TESSDATA_PREFIX = os.environ.get("TESSDATA_PREFIX") or os.path.join(TOOLS, "tesseract", "tessdata")
-
-
-# --- Helper: detect if PDF has selectable text ---
-def _pdf_has_text(pdf_path, sample_pages=3):
-    try:
-        with pdfplumber.open(pdf_path) as pdf:
-            for i in range(min(sample_pages, len(pdf.pages))):
-                if (pdf.pages[i].extract_text() or "").strip():
-                    return True
-    except Exception:
-        pass
-    return False
-
-
-# --- Run OCRmyPDF ---
-def _ocr_to_searchable_pdf(input_pdf, output_pdf, lang="eng"):
-    env = os.environ.copy()
-    if os.path.exists(TESSERACT):
-        env["TESSERACT_PATH"] = TESSERACT
-    if os.path.exists(TESSDATA_PREFIX):
-        env["TESSDATA_PREFIX"] = TESSDATA_PREFIX
-
-    cmd = [
-        sys.executable, "-m", "ocrmypdf",
-        "--skip-text", "--rotate-pages", "--deskew", "--clean",
-        "--remove-background", "--optimize", "1",
-        "--language", lang,
-        input_pdf, output_pdf
-    ]
-
-    try:
-        proc = subprocess.run(cmd, env=env, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-        return proc.returncode == 0 and os.path.exists(output_pdf) and os.path.getsize(output_pdf) > 1024
-    except Exception:
-        return False
-
-
-# --- Convert PDF to DOCX using pdf2docx (layout mode) ---
-def _pdf_to_docx_layout(input_pdf, output_docx):
-    try:
-        from pdf2docx import Converter
-        cv = Converter(input_pdf)
-        cv.convert(output_docx, start=0, end=None)
-        cv.close()
-        return os.path.exists(output_docx) and os.path.getsize(output_docx) > 1024
-    except Exception:
-        return False
-
-
-# --- Extract tables and append to DOCX (fallback) ---
-def _append_tables(pdf_path, output_docx):
-    try:
-        tabula.environment_info.java_path = JAVA_EXE if os.path.exists(JAVA_EXE) else None
-        tables = tabula.read_pdf(pdf_path, pages="all", multiple_tables=True, lattice=True, stream=False,
-                                 java_options=["-Djava.awt.headless=true"], pandas_options={"dtype": str}) or []
-        if not tables:
-            tables = tabula.read_pdf(pdf_path, pages="all", multiple_tables=True, lattice=False, stream=True,
-                                     java_options=["-Djava.awt.headless=true"], pandas_options={"dtype": str}) or []
-    except Exception:
-        tables = []
-
-    if not tables:
-        try:
-            with pdfplumber.open(pdf_path) as pdf:
-                for page in pdf.pages:
-                    for tbl in page.extract_tables() or []:
-                        tables.append(tbl)
-        except Exception:
-            pass
-
-    if not tables:
-        return
-
-    doc = Document(output_docx)
-    doc.add_page_break()
-    doc.add_paragraph("Extracted Tables (auto)").bold = True
-
-    for tbl in tables:
-        try:
-            rows = tbl.values.tolist() if hasattr(tbl, "values") else tbl
-            t = doc.add_table(rows=len(rows), cols=len(rows[0]))
-            t.style = "Table Grid"
-            for i, row in enumerate(rows):
-                for j, cell in enumerate(row):
-                    t.cell(i, j).text = "" if cell is None else str(cell)
-            doc.add_paragraph()
-        except Exception:
-            continue
-
-    doc.save(output_docx)
-
-
-# === Main function called by app.py ===
-def convert_pdf_to_docx(pdf_path, out_docx):
-    pdf_path = str(Path(pdf_path))
-    out_docx = str(Path(out_docx))
-
-    if _pdf_has_text(pdf_path):
-        ok = _pdf_to_docx_layout(pdf_path, out_docx)
-        if ok:
-            _append_tables(pdf_path, out_docx)
-        return ok
-
-    with tempfile.TemporaryDirectory() as td:
-        searchable_pdf = os.path.join(td, "searchable.pdf")
-        if not _ocr_to_searchable_pdf(pdf_path, searchable_pdf):
-            return False
-        ok = _pdf_to_docx_layout(searchable_pdf, out_docx)
-        if ok:
-            _append_tables(pdf_path, out_docx)
-        return ok
-
-
-if __name__ == "__main__":
-    import argparse
-    ap = argparse.ArgumentParser()
-    ap.add_argument("pdf", help="Input PDF")
-    ap.add_argument("docx", help="Output DOCX")
-    args = ap.parse_args()
-    print("SUCCESS" if convert_pdf_to_docx(args.pdf, args.docx) else "FAILED")
+import os
+import tempfile
+import threading
+from pathlib import Path
+import pdfplumber
+from docx.table import _Cell
+from page_index import build_page_index, scanned_pages, table_pages
+from table_extractor import extract_tables
+from pdf_layout import layout_document
+from metrics import stage
+import fast_docx
+
+# === Tools ===
+ROOT = os.path.abspath(os.getcwd())
+TOOLS = os.path.join(ROOT, "tools")
+
+TESSERACT = os.environ.get("TESSERACT_PATH") or os.path.join(TOOLS, "tesseract", "tesseract.exe")
+POPPLER_BIN = os.environ.get("POPPLER_PATH") or os.path.join(TOOLS, "poppler", "bin")
+JAVA_EXE = os.environ.get("JAVA_PATH") or os.path.join(TOOLS, "java", "bin", "java.exe")
+TABULA_JAR = os.environ.get("TABULA_JAR") or os.path.join(TOOLS, "tabula", "tabula.jar")
+TESSDATA_PREFIX = os.environ.get("TESSDATA_PREFIX") or os.path.join(TOOLS, "tesseract", "tessdata")
+
+
+# --- Helper: per-page index (text chars, image coverage, scanned) ---
+def _page_index(pdf_path):
+    with stage("page_index") as span:
+        try:
+            index = build_page_index(pdf_path)
+        except Exception:
+            index = []
+        span["pages"] = len(index)
+    return index
+
+
+def _page_ranges(pages):
+    """[1, 2, 3, 7] -> "1-3,7" (the format of ocrmypdf --pages)"""
+    parts, start, prev = [], None, None
+    for n in sorted(pages):
+        if start is None:
+            start = prev = n
+        elif n == prev + 1:
+            prev = n
+        else:
+            parts.append(str(start) if start == prev else "%d-%d" % (start, prev))
+            start = prev = n
+    if start is not None:
+        parts.append(str(start) if start == prev else "%d-%d" % (start, prev))
+    return ",".join(parts)
+
+
+# --- OCR profiles: keyword arguments for ocrmypdf.ocr() ---
+OCR_PROFILES = {
+    # clean scans: no image preprocessing, no output optimization
+    "fast": {"rotate_pages": False, "deskew": False, "clean": False, "remove_background": False, "optimize": 0},
+    # fix skewed/rotated pages, skip the expensive cleanup filters
+    "balanced": {"rotate_pages": True, "deskew": True, "clean": False, "remove_background": False, "optimize": 1},
+    # the full preprocessing chain for poor scans
+    "quality": {"rotate_pages": True, "deskew": True, "clean": True, "remove_background": True, "optimize": 1},
+}
+DEFAULT_OCR_PROFILE = os.environ.get("OCR_PROFILE") or "balanced"
+# worker threads one job may use for OCR; the web app passes its per-job share of the CPU budget
+OCR_JOBS = int(os.environ.get("OCR_JOBS") or os.cpu_count() or 1)
+# ocrmypdf.ocr() runs one call per process at a time anyway; taking this lock first makes
+# setting ocr_progress.callback part of the same turn, so jobs on other threads never see it
+_ocr_lock = threading.Lock()
+
+
+# --- Run OCRmyPDF (in-process API) ---
+def _ocr_to_searchable_pdf(input_pdf, output_pdf, lang="eng", pages=None, profile=None, jobs=None, progress=None):
+    import ocrmypdf
+    import ocr_progress
+
+    if os.path.exists(TESSERACT):
+        tess_dir = os.path.dirname(TESSERACT)
+        if tess_dir not in os.environ.get("PATH", "").split(os.pathsep):
+            os.environ["PATH"] = tess_dir + os.pathsep + os.environ.get("PATH", "")
+    if os.path.exists(TESSDATA_PREFIX):
+        os.environ["TESSDATA_PREFIX"] = TESSDATA_PREFIX
+
+    options = dict(OCR_PROFILES.get(profile or DEFAULT_OCR_PROFILE, OCR_PROFILES["balanced"]))
+    # a plain PDF: PDF/A output runs every page, text pages included, through Ghostscript
+    options.update(output_type="pdf")
+    if pages:
+        # OCR exactly the pages the index flagged (even ones with a stamp of text on top);
+        # every other page is copied through untouched
+        options.update(force_ocr=True, pages=_page_ranges(pages))
+    else:
+        options.update(skip_text=True)
+
+    # concurrent jobs in one process take turns here; the process executor gives each
+    # worker its own
+    with _ocr_lock:
+        try:
+            ocr_progress.callback = progress
+            result = ocrmypdf.ocr(input_pdf, output_pdf, language=lang, jobs=max(1, jobs or OCR_JOBS),
+                                  use_threads=True, progress_bar=False, plugins=["ocr_progress"], **options)
+            return result == ocrmypdf.ExitCode.ok and os.path.exists(output_pdf) and os.path.getsize(output_pdf) > 1024
+        except Exception:
+            return False
+        finally:
+            ocr_progress.callback = None
+
+
+# --- Original text pages + OCRed pages in one PDF for the layout ---
+def _merge_ocr_pages(original_pdf, searchable_pdf, ocr_pages, out_pdf):
+    """Save out_pdf: original_pdf with the pages in ocr_pages (1-based) taken from searchable_pdf."""
+    import fitz
+    wanted = set(ocr_pages)
+    with fitz.open(original_pdf) as original, fitz.open(searchable_pdf) as searchable, fitz.open() as merged:
+        start = 0
+        for n in range(1, original.page_count + 1):
+            # copy runs of consecutive pages from the same source at once
+            if n == original.page_count or ((n + 1) in wanted) != (n in wanted):
+                src = searchable if n in wanted else original
+                merged.insert_pdf(src, from_page=start, to_page=n - 1)
+                start = n
+        merged.save(out_pdf, garbage=1)
+
+
+# --- Lay out PDF pages with pdf2docx into an in-memory Document (layout mode) ---
+def _pdf_to_document(input_pdf, progress=None):
+    """pdf2docx layout (chunked across processes for big files) without saving; Document or None."""
+    try:
+        return layout_document(input_pdf, progress=progress)
+    except Exception:
+        return None
+
+
+# --- Write table rows straight into the table XML ---
+def _add_table(doc, rows):
+    cols = max(len(r) for r in rows)
+    t = doc.add_table(rows=len(rows), cols=cols)
+    t.style = "Table Grid"
+    # walk <w:tr>/<w:tc> once; t.cell(i, j) rebuilds the whole cell grid on every call
+    for tr, values in zip(t._tbl.tr_lst, rows):
+        for tc, cell in zip(tr.tc_lst, values):
+            if cell is not None and str(cell) != "":
+                _Cell(tc, t).text = str(cell)
+    return t
+
+
+# --- Extract tables and append them to the Document (fallback) ---
+def _append_tables(pdf_path, doc, index=None, progress=None):
+    # only pages the index saw ruling lines or column-aligned text on; a PDF
+    # without any never touches the JVM
+    pages = table_pages(index) if index else "all"
+    if not pages:
+        return
+
+    try:
+        tables = extract_tables(pdf_path, pages, progress)
+    except Exception:
+        tables = []
+
+    if not tables:
+        try:
+            with pdfplumber.open(pdf_path) as pdf:
+                todo = pdf.pages if pages == "all" else [pdf.pages[n - 1] for n in pages]
+                for done, page in enumerate(todo, start=1):
+                    for tbl in page.extract_tables() or []:
+                        tables.append(tbl)
+                    if progress:
+                        progress("tables", done, len(todo))
+        except Exception:
+            pass
+
+    if not tables:
+        return
+
+    doc.add_page_break()
+    doc.add_paragraph().add_run("Extracted Tables (auto)").bold = True
+
+    for tbl in tables:
+        try:
+            rows = tbl.values.tolist() if hasattr(tbl, "values") else tbl
+            if not rows:
+                continue
+            _add_table(doc, rows)
+            doc.add_paragraph()
+        except Exception:
+            continue
+
+
+# --- Build the whole DOCX in memory and serialize it once ---
+def _assemble_docx(layout_pdf, tables_pdf, out_docx, index, progress=None):
+    with stage("layout", pages=len(index) or None):
+        doc = _pdf_to_document(layout_pdf, progress)
+    if doc is None:
+        return False
+    with stage("tables", pages=len(table_pages(index)) if index else None):
+        _append_tables(tables_pdf, doc, index, progress)
+    with stage("save"):
+        doc.save(out_docx)
+    return os.path.exists(out_docx) and os.path.getsize(out_docx) > 1024
+
+
+# --- Fast mode: text layer only, no layout analysis or table extraction ---
+def _convert_fast(pdf_path, out_docx, ocr_profile=None, ocr_jobs=None, progress=None):
+    with stage("page_index"):
+        to_ocr = fast_docx.scanned_pages(pdf_path)
+    with tempfile.TemporaryDirectory() as td:
+        source = pdf_path
+        if to_ocr:
+            source = os.path.join(td, "searchable.pdf")
+            with stage("ocr", pages=len(to_ocr)):
+                if not _ocr_to_searchable_pdf(pdf_path, source, pages=to_ocr, profile=ocr_profile,
+                                              jobs=ocr_jobs, progress=progress):
+                    return False
+        with stage("text"):
+            doc = fast_docx.build_document(source, progress=progress)
+    with stage("save"):
+        doc.save(out_docx)
+    return os.path.exists(out_docx)
+
+
+# === Main function called by app.py ===
+MODES = ("layout", "fast")
+
+
+def convert_pdf_to_docx(pdf_path, out_docx, ocr_profile=None, ocr_jobs=None, progress=None, mode="layout"):
+    """
+    progress(stage, done, total), if given, is called per page for "ocr", "layout", "docx" and "tables"
+    ("ocr" and "text" in fast mode). mode="fast" builds a text-only DOCX (paragraphs, headings,
+    page breaks) from the text layer instead of running pdf2docx and table extraction.
+    """
+    pdf_path = str(Path(pdf_path))
+    out_docx = str(Path(out_docx))
+    if mode == "fast":
+        return _convert_fast(pdf_path, out_docx, ocr_profile, ocr_jobs, progress)
+
+    # one pass decides, page by page, what needs OCR
+    index = _page_index(pdf_path)
+    to_ocr = scanned_pages(index) if index else None
+
+    if index and not to_ocr:
+        return _assemble_docx(pdf_path, pdf_path, out_docx, index, progress)
+
+    with tempfile.TemporaryDirectory() as td:
+        searchable_pdf = os.path.join(td, "searchable.pdf")
+        with stage("ocr", pages=len(to_ocr) if to_ocr else None):
+            ok = _ocr_to_searchable_pdf(pdf_path, searchable_pdf, pages=to_ocr, profile=ocr_profile, jobs=ocr_jobs,
+                                        progress=progress)
+            if ok and to_ocr:
+                # only the OCRed pages come from ocrmypdf's output; pdf2docx reads the text
+                # pages as they were uploaded, and still sees every page in order
+                layout_pdf = os.path.join(td, "layout.pdf")
+                _merge_ocr_pages(pdf_path, searchable_pdf, to_ocr, layout_pdf)
+            else:
+                layout_pdf = searchable_pdf
+        if not ok:
+            return False
+        return _assemble_docx(layout_pdf, pdf_path, out_docx, index, progress)
+
+
+if __name__ == "__main__":
+    import argparse
+    ap = argparse.ArgumentParser()
+    ap.add_argument("pdf", help="Input PDF")
+    ap.add_argument("docx", help="Output DOCX")
+    ap.add_argument("--profile", choices=sorted(OCR_PROFILES), default=DEFAULT_OCR_PROFILE,
+                    help="OCR speed/quality profile for scanned pages")
+    ap.add_argument("--ocr-jobs", type=int, default=OCR_JOBS, help="Threads OCR may use")
+    ap.add_argument("--mode", choices=MODES, default="layout",
+                    help="layout (pdf2docx + tables) or fast (text, headings and page breaks only)")
+    args = ap.parse_args()
+    ok = convert_pdf_to_docx(args.pdf, args.docx, ocr_profile=args.profile, ocr_jobs=args.ocr_jobs,
+                             mode=args.mode)
+    print("SUCCESS" if ok else "FAILED")
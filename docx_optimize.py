@@ -0,0 +1,198 @@
+import hashlib
+import io
+import os
+import posixpath
+import re
+import time
+import zipfile
+import xml.etree.ElementTree as ET
+
+# embedded images are resampled to this many pixels per displayed inch (0 = leave them alone)
+IMAGE_DPI = int(os.environ.get("DOCX_IMAGE_DPI") or 150)
+JPEG_QUALITY = int(os.environ.get("DOCX_JPEG_QUALITY") or 80)
+# images at most this much larger than the target keep their pixels (resampling would gain little)
+RESAMPLE_SLACK = 1.25
+
+_NS = {
+    "wp": "http://schemas.openxmlformats.org/drawingml/2006/wordprocessingDrawing",
+    "a": "http://schemas.openxmlformats.org/drawingml/2006/main",
+    "r": "http://schemas.openxmlformats.org/officeDocument/2006/relationships",
+}
+_EMU_PER_INCH = 914400
+_IMAGE_EXTS = {".png", ".jpg", ".jpeg", ".bmp", ".gif", ".tif", ".tiff"}
+_CONTENT_TYPES = {".png": "image/png", ".jpeg": "image/jpeg"}
+
+
+def _rels_name(part):
+    return posixpath.join(posixpath.dirname(part), "_rels", posixpath.basename(part) + ".rels")
+
+
+def _rels_targets(xml, part):
+    """{rId: package path} for the internal targets in a part's .rels file."""
+    targets = {}
+    for rel in ET.fromstring(xml):
+        if rel.get("TargetMode") == "External":
+            continue
+        targets[rel.get("Id")] = posixpath.normpath(posixpath.join(posixpath.dirname(part), rel.get("Target")))
+    return targets
+
+
+def _displayed_inches(zin, names):
+    """Largest displayed (width, height) in inches of each media part, from the drawings that embed it."""
+    shown = {}
+    for part in names:
+        if not (part.startswith("word/") and part.endswith(".xml")) or _rels_name(part) not in names:
+            continue
+        targets = _rels_targets(zin.read(_rels_name(part)), part)
+        root = ET.fromstring(zin.read(part))
+        for tag in ("inline", "anchor"):
+            for drawing in root.iter("{%s}%s" % (_NS["wp"], tag)):
+                extent = drawing.find("wp:extent", _NS)
+                if extent is None:
+                    continue
+                size = (int(extent.get("cx")) / _EMU_PER_INCH, int(extent.get("cy")) / _EMU_PER_INCH)
+                for blip in drawing.iter("{%s}blip" % _NS["a"]):
+                    media = targets.get(blip.get("{%s}embed" % _NS["r"]))
+                    if media:
+                        w, h = shown.get(media, (0.0, 0.0))
+                        shown[media] = (max(w, size[0]), max(h, size[1]))
+    return shown
+
+
+def _encode(img, dpi_size, dpi, quality):
+    """(bytes, extension, resampled) for one image: resampled to dpi_size, PNG or JPEG by content."""
+    from PIL import Image
+    resampled = False
+    if dpi_size and dpi:
+        target = (max(1, round(dpi_size[0] * dpi)), max(1, round(dpi_size[1] * dpi)))
+        if img.width > target[0] * RESAMPLE_SLACK and img.height > target[1] * RESAMPLE_SLACK:
+            img = img.resize(target, Image.LANCZOS)
+            resampled = True
+
+    has_alpha = img.mode in ("RGBA", "LA") or (img.mode == "P" and "transparency" in img.info)
+    colours = None if img.mode == "1" else img.getcolors(256)
+    png = io.BytesIO()
+    if has_alpha or img.mode == "1" or (colours is not None and len(colours) <= 16):
+        # transparency and flat line art / text stay lossless
+        img.save(png, "PNG")
+        return png.getvalue(), ".png", resampled
+    if img.mode not in ("RGB", "L"):
+        img = img.convert("RGB")
+    jpeg = io.BytesIO()
+    img.save(jpeg, "JPEG", quality=quality, optimize=True)
+    if colours is None:
+        return jpeg.getvalue(), ".jpeg", resampled
+    # few grey levels / colours: a clean chart compresses better as PNG, a noisy scan as JPEG
+    img.save(png, "PNG")
+    if png.tell() <= jpeg.tell():
+        return png.getvalue(), ".png", resampled
+    return jpeg.getvalue(), ".jpeg", resampled
+
+
+def optimize_docx(path, dpi=IMAGE_DPI, quality=JPEG_QUALITY):
+    """
+    Shrink the images embedded in a DOCX in place: each one is resampled to `dpi` for its
+    largest displayed size, re-encoded as PNG or JPEG (whichever suits the content; the
+    original is kept when that is not smaller) and identical media parts are merged.
+    The package is streamed once into a temp file that replaces the original; only one
+    image is held in memory at a time, and the .rels files are written last, once every
+    media part has its final name.
+    Returns {"bytes_before", "bytes_after", "images", "resampled", "recompressed", "deduplicated", "seconds"}.
+    """
+    t0 = time.perf_counter()
+    report = {"bytes_before": os.path.getsize(path), "images": 0, "resampled": 0, "recompressed": 0,
+              "deduplicated": 0}
+    tmp = path + ".opt"
+    with zipfile.ZipFile(path) as zin:
+        names = set(zin.namelist())
+        shown = _displayed_inches(zin, names)
+        content_types = zin.read("[Content_Types].xml").decode("utf-8")
+        renamed, written, seen = {}, set(), {}   # old -> new name / names in the output / sha256 -> name
+        deferred = []
+        with zipfile.ZipFile(tmp, "w", zipfile.ZIP_DEFLATED) as zout:
+            for info in zin.infolist():
+                name = info.filename
+                if name.endswith(".rels"):
+                    deferred.append(info)
+                    continue
+                if name == "[Content_Types].xml":
+                    zout.writestr(info, _content_types(content_types))
+                    continue
+                # parts with their own content type entry keep their name and bytes
+                if (not name.startswith("word/media/") or posixpath.splitext(name)[1].lower() not in _IMAGE_EXTS
+                        or 'PartName="/%s"' % name in content_types):
+                    zout.writestr(info, zin.read(name))
+                    continue
+
+                report["images"] += 1
+                data, final = _optimize_image(zin.read(name), info, shown.get(name), dpi, quality, report)
+                if final != name:
+                    while final in names or final in written:
+                        final = posixpath.splitext(final)[0] + "_" + posixpath.splitext(final)[1]
+                digest = hashlib.sha256(data).hexdigest()
+                if digest in seen:
+                    final = seen[digest]
+                    report["deduplicated"] += 1
+                else:
+                    seen[digest] = final
+                    written.add(final)
+                    if final == name:
+                        zout.writestr(info, data)
+                    else:
+                        # re-encoded images gain nothing from deflate
+                        zout.writestr(final, data, compress_type=zipfile.ZIP_STORED)
+                if final != name:
+                    renamed[name] = final
+
+            for info in deferred:
+                data = zin.read(info.filename)
+                zout.writestr(info, _retarget(data, info.filename, renamed) if renamed else data)
+    if report["recompressed"] or report["deduplicated"]:
+        os.replace(tmp, path)
+    else:
+        os.remove(tmp)   # nothing gained: keep the original bytes
+
+    report["bytes_after"] = os.path.getsize(path)
+    report["seconds"] = round(time.perf_counter() - t0, 3)
+    return report
+
+
+def _optimize_image(data, info, shown, dpi, quality, report):
+    """(bytes, part name) for one media part: re-encoded if that is smaller in the package, else unchanged."""
+    from PIL import Image
+    name = info.filename
+    try:
+        with Image.open(io.BytesIO(data)) as img:
+            img.load()
+            source = img.format
+            encoded, ext, resampled = _encode(img, shown, dpi, quality)
+    except Exception as e:
+        print("image", name, "left as is:", e)
+        return data, name
+    # a JPEG kept at its size would only lose quality to a second lossy pass
+    if len(encoded) >= info.compress_size or (source == "JPEG" and not resampled):
+        return data, name
+    report["resampled"] += resampled
+    report["recompressed"] += 1
+    return encoded, name if name.endswith(ext) else posixpath.splitext(name)[0] + ext
+
+
+def _retarget(xml, rels_name, renamed):
+    # .rels targets are relative to the folder of the part the .rels file belongs to
+    base = posixpath.dirname(posixpath.dirname(rels_name))
+
+    def sub(m):
+        target = posixpath.normpath(posixpath.join(base, m.group(1)))
+        if target not in renamed:
+            return m.group(0)
+        return 'Target="%s"' % posixpath.relpath(renamed[target], base or ".")
+
+    return re.sub(r'Target="([^"]+)"', sub, xml.decode("utf-8")).encode("utf-8")
+
+
+def _content_types(text):
+    # re-encoded images are typed by extension, so both Default entries must exist
+    for ext, ctype in _CONTENT_TYPES.items():
+        if 'Extension="%s"' % ext[1:] not in text:
+            text = text.replace("</Types>", '<Default Extension="%s" ContentType="%s"/></Types>' % (ext[1:], ctype))
+    return text.encode("utf-8")
@@ -0,0 +1,117 @@
+import re
+from collections import Counter
+
+from docx import Document
+
+from page_index import is_scanned
+
+# lines whose font is this much larger than the body text become headings (level 1, level 2)
+HEADING_RATIOS = (1.5, 1.2)
+# a vertical gap wider than this many line heights starts a new paragraph
+PARAGRAPH_GAP = 0.6
+
+
+# --- Text layer (PyMuPDF) ---
+def _page_lines(page):
+    """
+    [(text, size, top, bottom, x0)] for each horizontal text line in reading order: blocks
+    as PyMuPDF orders them (one column after the other), lines top to bottom within a block.
+    """
+    lines = []
+    for block in page.get_text("dict", flags=0)["blocks"]:
+        block_lines = []
+        for line in block.get("lines", ()):
+            if line.get("wmode", 0) != 0:
+                continue
+            spans = [s for s in line["spans"] if s["text"].strip()]
+            if not spans:
+                continue
+            text = "".join(s["text"] for s in line["spans"]).strip()
+            # the line's size is that of most of its characters
+            sizes = Counter()
+            for s in spans:
+                sizes[round(s["size"], 1)] += len(s["text"].strip())
+            x0, top, _, bottom = line["bbox"]
+            block_lines.append((text, sizes.most_common(1)[0][0], top, bottom, x0))
+        block_lines.sort(key=lambda l: (round(l[2]), l[4]))
+        lines.extend(block_lines)
+    return lines
+
+
+def scanned_pages(pdf_path):
+    """1-based numbers of the pages that need OCR."""
+    import fitz
+    with fitz.open(pdf_path) as pdf:
+        return [page.number + 1 for page in pdf if is_scanned(page)]
+
+
+# --- Lines -> paragraphs ---
+def _paragraphs(lines):
+    """Join consecutive lines of the same size and normal spacing: [(text, size)]."""
+    paras = []
+    prev = None
+    for text, size, top, bottom, _ in lines:
+        height = max(bottom - top, 1.0)
+        # a line above the previous one starts the next column
+        if (prev is not None and abs(size - prev[1]) <= 0.5
+                and prev[2] <= top and top - prev[3] <= PARAGRAPH_GAP * height):
+            joined = paras[-1][0]
+            # words hyphenated across the line break are glued back together
+            joined = joined[:-1] + text if joined.endswith("-") else joined + " " + text
+            paras[-1] = (joined, size)
+        else:
+            paras.append((text, size))
+        prev = (text, size, top, bottom)
+    return paras
+
+
+def _ocr_paragraphs(text):
+    """Tesseract output: blank lines separate paragraphs."""
+    for block in re.split(r"\n\s*\n", text or ""):
+        joined = " ".join(l.strip() for l in block.splitlines() if l.strip())
+        if joined:
+            yield joined
+
+
+def _body_size(pages_lines):
+    sizes = Counter()
+    for lines in pages_lines:
+        for text, size, *_ in lines:
+            sizes[size] += len(text)
+    return sizes.most_common(1)[0][0] if sizes else 10.0
+
+
+def build_document(pdf_path, ocr_text=None, progress=None):
+    """
+    Text-only DOCX straight from the PDF text layer, without pdf2docx layout analysis:
+    lines are grouped into paragraphs by font size and spacing, larger lines become
+    headings and every PDF page starts a new DOCX page. ocr_text ({page number: text})
+    replaces the text layer of the pages it covers (scanned pages).
+    progress("text", done, total) is called per page.
+    """
+    import fitz
+    ocr_text = ocr_text or {}
+    doc = Document()
+    with fitz.open(pdf_path) as pdf:
+        total = pdf.page_count
+        # body size over the whole document, so a page of large print is not all "body"
+        pages_lines = [[] if page.number + 1 in ocr_text else _page_lines(page) for page in pdf]
+    body = _body_size(pages_lines)
+
+    for n, lines in enumerate(pages_lines, start=1):
+        if n > 1:
+            doc.add_page_break()
+        if n in ocr_text:
+            for para in _ocr_paragraphs(ocr_text[n]):
+                doc.add_paragraph(para)
+        else:
+            for text, size in _paragraphs(lines):
+                if size >= body * HEADING_RATIOS[0] and len(text) < 200:
+                    doc.add_heading(text, level=1)
+                elif size >= body * HEADING_RATIOS[1] and len(text) < 200:
+                    doc.add_heading(text, level=2)
+                else:
+                    doc.add_paragraph(text)
+        if progress:
+            progress("text", n, total)
+    return doc
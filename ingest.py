@@ -0,0 +1,161 @@
+import hashlib
+import os
+import re
+import tempfile
+import uuid
+
+# the PDF header may be preceded by up to this much junk
+HEADER_WINDOW = 1024
+# other file parts stay in memory up to this size, then go to a temporary file
+SPOOL_MEMORY = 1024 * 1024
+# bytes of the previous chunk kept when scanning, so a token split between chunks is still seen
+_OVERLAP = 256
+_PAGES_COUNT = re.compile(rb"/Type\s*/Pages\b[^>]{0,4096}?/Count\s+(\d+)|/Count\s+(\d+)[^>]{0,4096}?/Type\s*/Pages\b")
+
+
+class UploadRejected(Exception):
+    """An upload refused while or right after it is stored; the message is the response body."""
+
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.status = status
+
+
+class PDFProbe:
+    """
+    Looks at a PDF while its bytes go by: the header, and the page count of uncompressed
+    page tree nodes. Only a few hundred bytes are kept between chunks. Page trees inside
+    object streams, and encryption (the trailer comes last), are left to IngestFile.finish().
+    """
+
+    def __init__(self, max_pages=0):
+        self.max_pages = max_pages
+        self.header = None         # b"%PDF-1.x" once found
+        self.pages = None          # largest /Count of a /Pages node seen so far
+        self._head = b""
+        self._tail = b""
+
+    def feed(self, data):
+        if self.header is None:
+            self._head = (self._head + data)[:HEADER_WINDOW]
+            self._check_header(final=False)
+        window = self._tail + data
+        for m in _PAGES_COUNT.finditer(window):
+            count = int(m.group(1) or m.group(2))
+            self.pages = max(self.pages or 0, count)
+        if self.max_pages and self.pages and self.pages > self.max_pages:
+            raise UploadRejected("PDF has more than %d pages" % self.max_pages, 413)
+        self._tail = window[-_OVERLAP:]
+
+    def finish(self):
+        if self.header is None:
+            self._check_header(final=True)
+
+    def _check_header(self, final):
+        pos = self._head.find(b"%PDF-")
+        if pos >= 0:
+            self.header = self._head[pos:pos + 8]
+            self._head = b""
+        elif final or len(self._head) >= HEADER_WINDOW:
+            raise UploadRejected("not a PDF file")
+
+
+class IngestFile:
+    """
+    Writable file an uploaded PDF is streamed into (e.g. as the multipart parser's file
+    stream): bytes go straight to `directory`/<uuid>.pdf while they are hashed and probed,
+    so no second copy is made, and the upload is rejected - its file removed - as soon as
+    it passes `max_bytes` or is clearly not a PDF. finish() runs the remaining checks.
+    """
+
+    def __init__(self, directory, max_bytes=0, max_pages=0):
+        self.name = str(uuid.uuid4()) + ".pdf"
+        self.path = os.path.join(directory, self.name)
+        self.max_bytes = max_bytes
+        self.max_pages = max_pages
+        self.size = 0
+        self.sha256 = None         # hex digest, set by finish()
+        self.pages = None          # page count, set by finish()
+        self.kept = False          # set once a job owns the file; see discard()
+        self._hash = hashlib.sha256()
+        self._probe = PDFProbe(max_pages)
+        self._f = open(self.path, "w+b")
+
+    def write(self, data):
+        self.size += len(data)
+        try:
+            if self.max_bytes and self.size > self.max_bytes:
+                raise UploadRejected("file is larger than %d MB" % (self.max_bytes // (1024 * 1024)), 413)
+            self._probe.feed(data)
+        except UploadRejected:
+            self.discard()
+            raise
+        self._hash.update(data)
+        return self._f.write(data)
+
+    def __getattr__(self, name):
+        # read / seek / tell etc. for whoever reads the upload back
+        return getattr(self._f, name)
+
+    def close(self):
+        self._f.close()
+
+    def finish(self):
+        """
+        Close the file and check it opens as a PDF without a password, within max_pages.
+        Returns self; raises UploadRejected (file removed) otherwise.
+        """
+        import fitz
+        self._f.close()
+        try:
+            self._probe.finish()
+            try:
+                pdf = fitz.open(self.path, filetype="pdf")
+            except Exception:
+                raise UploadRejected("not a readable PDF")
+            with pdf:
+                if pdf.needs_pass:
+                    raise UploadRejected("PDF is password-protected")
+                self.pages = pdf.page_count
+            if not self.pages:
+                raise UploadRejected("PDF has no pages")
+            if self.max_pages and self.pages > self.max_pages:
+                raise UploadRejected("PDF has more than %d pages" % self.max_pages, 413)
+        except UploadRejected:
+            self.discard()
+            raise
+        self.sha256 = self._hash.hexdigest()
+        return self
+
+    def discard(self):
+        """Remove the stored file (no-op once it is gone)."""
+        self._f.close()
+        try:
+            os.remove(self.path)
+        except FileNotFoundError:
+            pass
+
+
+class SpooledUpload:
+    """
+    Temporary file a non-PDF file part (e.g. a ZIP of PDFs) is streamed into; the upload
+    is rejected with 413 as soon as it passes `max_bytes` (0 = no limit).
+    """
+
+    def __init__(self, max_bytes=0):
+        self.max_bytes = max_bytes
+        self.size = 0
+        self._f = tempfile.SpooledTemporaryFile(max_size=SPOOL_MEMORY, mode="w+b")
+
+    def write(self, data):
+        self.size += len(data)
+        if self.max_bytes and self.size > self.max_bytes:
+            self._f.close()
+            raise UploadRejected("file is larger than %d MB" % (self.max_bytes // (1024 * 1024)), 413)
+        return self._f.write(data)
+
+    def __getattr__(self, name):
+        return getattr(self._f, name)
+
+    def close(self):
+        self._f.close()
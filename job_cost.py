@@ -0,0 +1,66 @@
+import os
+
+from page_index import is_scanned
+
+# rough single-core seconds per page, by conversion mode and page kind
+SECONDS_PER_PAGE = {
+    "layout": {"text": 0.3, "scanned": 4.0},
+    "fast": {"text": 0.01, "scanned": 3.0},
+}
+# interpreter, pdf2docx/PyMuPDF and python-docx before any page is held
+BASE_MB = 200
+# pdf2docx keeps every parsed text page in memory until the DOCX is written
+LAYOUT_MB_PER_PAGE = 2
+# pdf_layout's setting: from this many pages on the layout is parsed by a process pool
+LAYOUT_CHUNK_MIN_PAGES = int(os.environ.get("LAYOUT_CHUNK_MIN_PAGES") or 40)
+# the text layer of at most this many pages, spread over the document, is looked at
+SAMPLE_PAGES = 50
+
+
+def estimate(pdf_path, mode="layout", dpi=300, ocr_threads=1, window=4, layout_jobs=1):
+    """
+    Cheap upfront estimate of what converting a PDF will take:
+      pages / scanned_pages  from the text layer (a page with almost no text needs OCR) of
+                             up to SAMPLE_PAGES pages, extrapolated to the whole document,
+      cost_seconds           single-core conversion time,
+      mem_mb                 peak memory, dominated by page bitmaps at `dpi` for scanned pages,
+      cpu                    cores the job occupies while it runs.
+    """
+    import fitz
+    scanned, largest = 0, 0.0
+    with fitz.open(pdf_path) as pdf:
+        pages = pdf.page_count
+        sample = sorted({i * pages // SAMPLE_PAGES for i in range(SAMPLE_PAGES)}) if pages > SAMPLE_PAGES else range(pages)
+        for n in sample:
+            page = pdf[n]
+            if is_scanned(page):
+                scanned += 1
+                largest = max(largest, page.rect.width * page.rect.height)
+        scanned = round(scanned * pages / max(1, len(sample)))
+    rates = SECONDS_PER_PAGE.get(mode, SECONDS_PER_PAGE["layout"])
+    text = pages - scanned
+    mem = BASE_MB + (LAYOUT_MB_PER_PAGE * text if mode == "layout" else 0)
+    if scanned:
+        # 24-bit bitmap of the largest scanned page; the rasterizer keeps up to two windows
+        # alive and every OCR thread holds its own copy
+        bitmap_mb = largest * (dpi / 72.0) ** 2 * 3 / (1024 * 1024)
+        mem += bitmap_mb * (2 * window + ocr_threads)
+    cpu = max(1, ocr_threads) if scanned else 1
+    if mode == "layout" and pages >= LAYOUT_CHUNK_MIN_PAGES:
+        # the layout chunks run in up to layout_jobs processes at once
+        cpu = max(cpu, layout_jobs)
+    return {
+        "pages": pages,
+        "scanned_pages": scanned,
+        "cost_seconds": round(text * rates["text"] + scanned * rates["scanned"], 1),
+        "mem_mb": round(mem),
+        "cpu": cpu,
+    }
+
+
+def memory_budget_mb():
+    """Default memory budget for running conversions: three quarters of physical RAM."""
+    try:
+        return int(os.sysconf("SC_PAGE_SIZE") * os.sysconf("SC_PHYS_PAGES") * 0.75 / (1024 * 1024))
+    except (ValueError, OSError, AttributeError):
+        return 4096
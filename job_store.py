@@ -0,0 +1,589 @@
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+import metrics
+
+FINISHED = ("done", "error", "cancelled", "timed_out")
+_FINISHED_SQL = "(%s)" % ", ".join("'%s'" % status for status in FINISHED)
+# a job whose worker lost its lease this many times is failed instead of reclaimed again
+MAX_ATTEMPTS = 3
+_CRASHED = "Conversion worker stopped responding %d times; giving up." % MAX_ATTEMPTS
+# resources a job's estimate reserves while it runs (see claim's budget)
+BUDGET_FIELDS = ("mem_mb", "cpu")
+# the only files the janitor touches: uploads and outputs named after a job id
+JOB_FILE = re.compile(r"[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}\.(pdf|docx)$")
+
+
+def _priority(rec, now, aging):
+    # estimated work, minus `aging` seconds for every second spent waiting
+    return (rec.get("cost_seconds") or 0) - aging * (now - (rec.get("created") or now))
+
+
+def _fits(rec, running, budget):
+    """Whether rec can start next to the running records without exceeding the budget."""
+    if not budget or not running:
+        return True     # a job bigger than the whole budget still runs, alone
+    for field in BUDGET_FIELDS:
+        limit = budget.get(field)
+        if limit is not None and sum(r.get(field) or 0 for r in running) + (rec.get(field) or 0) > limit:
+            return False
+    return True
+
+
+class JobStore:
+    """
+    In-process job records and queue, keyed by job id.
+    Records of finished jobs (status done/error, "finished" timestamp set) are dropped
+    `ttl` seconds after they finish, and the oldest finished ones go first once more than
+    `max_entries` are held. Queued and running jobs are never evicted.
+    Queued jobs are claimed shortest estimated job first (see claim) with a lease that the
+    claiming worker renews; SQLiteJobStore offers the same interface shared between
+    the processes of one host.
+    """
+
+    def __init__(self, ttl=86400, max_entries=10000, aging=1.0):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.aging = aging
+        self._lock = threading.Lock()
+        self._records = OrderedDict()   # job_id -> record, in creation order
+        self.evicted = {"ttl": 0, "cap": 0}
+
+    def __contains__(self, job_id):
+        with self._lock:
+            return job_id in self._records
+
+    def add(self, job_id, record):
+        with self._lock:
+            self._records[job_id] = dict(record, created=time.time())
+            self._enforce_cap()
+
+    def get(self, job_id):
+        """A copy of the record, or None."""
+        with self._lock:
+            rec = self._records.get(job_id)
+            return dict(rec) if rec is not None else None
+
+    def update(self, job_id, **fields):
+        with self._lock:
+            rec = self._records.get(job_id)
+            if rec is not None:
+                rec.update(fields)
+
+    def pop(self, job_id):
+        with self._lock:
+            return self._records.pop(job_id, None)
+
+    def finish(self, job_id):
+        """Mark a job finished; its TTL starts now."""
+        self.update(job_id, finished=time.time())
+
+    def cancel(self, job_id, message):
+        """
+        Cancel a job: a queued (or waiting) one is finished right away ("cancelled"); a running one gets
+        cancel_requested set for its worker to act on ("cancelling"). Returns the job's
+        status after the call, or None for an unknown job.
+        """
+        now = time.time()
+        with self._lock:
+            rec = self._records.get(job_id)
+            if rec is None:
+                return None
+            if rec["status"] in ("queued", "waiting"):
+                rec.update(status="cancelled", error=message, progress=0, finished=now)
+                return "cancelled"
+            if rec["status"] == "processing":
+                rec["cancel_requested"] = now
+                return "cancelling"
+            return rec["status"]
+
+    def find_active(self, key):
+        """Id of a queued or running job for this cache key, if any."""
+        with self._lock:
+            for job_id, rec in self._records.items():
+                if rec.get("key") == key and rec.get("status") not in FINISHED:
+                    return job_id
+        return None
+
+    def batch(self, batch_id):
+        """[(job_id, record)] of a batch's jobs, in the order they were added."""
+        with self._lock:
+            return [(job_id, dict(rec)) for job_id, rec in self._records.items() if rec.get("batch") == batch_id]
+
+    # --- queue ---
+    def claim(self, owner, lease, budget=None):
+        """
+        Take the next queued job (or one whose lease ran out) for `owner`; returns its id or None.
+        Jobs go by estimated cost_seconds minus `aging` x seconds waited, so short jobs run first
+        and long ones still move up. With a budget ({"mem_mb": .., "cpu": ..}) the next job only
+        starts if its estimate fits beside the running jobs; nothing overtakes it meanwhile.
+        """
+        now = time.time()
+        with self._lock:
+            while True:
+                waiting = [(_priority(rec, now, self.aging), i, job_id)
+                           for i, (job_id, rec) in enumerate(self._records.items())
+                           if rec["status"] == "queued"
+                           or (rec["status"] == "processing" and rec.get("lease_expires", 0) < now)]
+                if not waiting:
+                    return None
+                job_id = min(waiting)[2]
+                rec = self._records[job_id]
+                if rec.get("attempts", 0) >= MAX_ATTEMPTS:
+                    rec.update(status="error", error=_CRASHED, progress=0, finished=now, lease_owner=None)
+                    continue
+                running = [r for r in self._records.values()
+                           if r["status"] == "processing" and r.get("lease_expires", 0) >= now]
+                if not _fits(rec, running, budget):
+                    return None
+                rec.update(status="processing", lease_owner=owner, lease_expires=now + lease,
+                           attempts=rec.get("attempts", 0) + 1)
+                return job_id
+
+    def renew(self, job_ids, owner, lease):
+        """Extend the leases `owner` holds on job_ids; returns the ids whose lease was lost."""
+        lost = []
+        with self._lock:
+            for job_id in job_ids:
+                rec = self._records.get(job_id)
+                if rec is None or rec.get("lease_owner") != owner:
+                    lost.append(job_id)
+                else:
+                    rec["lease_expires"] = time.time() + lease
+        return lost
+
+    def release(self, job_id, owner):
+        with self._lock:
+            rec = self._records.get(job_id)
+            if rec is not None and rec.get("lease_owner") == owner:
+                rec["lease_owner"] = None
+
+    def position(self, job_id):
+        """1-based position of a queued job in claim order, or None once it has been picked up."""
+        now = time.time()
+        with self._lock:
+            order = sorted((_priority(rec, now, self.aging), i, qid)
+                           for i, (qid, rec) in enumerate(self._records.items()) if rec["status"] == "queued")
+        for pos, (_, _, qid) in enumerate(order, start=1):
+            if qid == job_id:
+                return pos
+        return None
+
+    def queued(self):
+        with self._lock:
+            return sum(1 for rec in self._records.values() if rec["status"] == "queued")
+
+    def waiting(self):
+        with self._lock:
+            return sum(1 for rec in self._records.values() if rec["status"] == "waiting")
+
+    def admit(self, max_queue):
+        """
+        Move the oldest "waiting" jobs (batch documents held back while the queue was full)
+        to "queued" until max_queue jobs are queued; returns how many moved.
+        """
+        with self._lock:
+            room = max_queue - sum(1 for rec in self._records.values() if rec["status"] == "queued")
+            moved = 0
+            for rec in self._records.values():
+                if moved >= room:
+                    break
+                if rec["status"] == "waiting":
+                    rec["status"] = "queued"
+                    moved += 1
+            return moved
+
+    # --- retention ---
+    def referenced_files(self):
+        """Upload and output file names still referenced by a record."""
+        with self._lock:
+            names = set()
+            for rec in self._records.values():
+                for field in ("in", "out"):
+                    if rec.get(field):
+                        names.add(rec[field])
+            return names
+
+    def expire(self, now=None):
+        """Drop finished records older than the TTL; returns how many were dropped."""
+        now = time.time() if now is None else now
+        with self._lock:
+            stale = [jid for jid, rec in self._records.items()
+                     if rec.get("finished") and now - rec["finished"] > self.ttl]
+            for jid in stale:
+                del self._records[jid]
+            _count_evicted(self, "ttl", len(stale))
+            return len(stale)
+
+    def stats(self):
+        with self._lock:
+            active = sum(1 for rec in self._records.values() if rec.get("status") not in FINISHED)
+            return {"records": len(self._records), "active": active,
+                    "max_entries": self.max_entries, "evicted": dict(self.evicted)}
+
+    # --- internals (called with the lock held) ---
+    def _enforce_cap(self):
+        excess = len(self._records) - self.max_entries
+        if excess <= 0:
+            return
+        victims = [jid for jid, rec in self._records.items() if rec.get("finished")][:excess]
+        for jid in victims:
+            del self._records[jid]
+        _count_evicted(self, "cap", len(victims))
+
+
+def _count_evicted(store, reason, n):
+    if n:
+        store.evicted[reason] += n
+        metrics.registry.inc("job_records_evicted_total", reason, n, label_name="reason")
+
+
+# columns of the jobs table; "in" is a keyword in SQL, so the record field is stored as in_name
+_FIELDS = ("status", "progress", "stage", "pages_done", "pages_total", "eta_seconds",
+           "in", "out", "error", "key", "options", "stages",
+           "created", "finished", "lease_owner", "lease_expires", "attempts",
+           "cost_seconds", "mem_mb", "cpu", "cancel_requested", "batch", "name")
+_JSON_FIELDS = ("options", "stages")
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+    id TEXT UNIQUE NOT NULL,
+    status TEXT NOT NULL,
+    progress INTEGER DEFAULT 0,
+    stage TEXT,
+    pages_done INTEGER,
+    pages_total INTEGER,
+    eta_seconds REAL,
+    in_name TEXT,
+    out TEXT,
+    error TEXT,
+    key TEXT,
+    options TEXT,
+    stages TEXT,
+    created REAL,
+    finished REAL,
+    lease_owner TEXT,
+    lease_expires REAL,
+    attempts INTEGER DEFAULT 0,
+    cost_seconds REAL,
+    mem_mb REAL,
+    cpu REAL,
+    cancel_requested REAL,
+    batch TEXT,
+    name TEXT
+);
+CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status, seq);
+CREATE INDEX IF NOT EXISTS jobs_key ON jobs (key);
+CREATE INDEX IF NOT EXISTS jobs_finished ON jobs (finished);
+"""
+# after the migration below, so older databases have the column by then
+_BATCH_INDEX = "CREATE INDEX IF NOT EXISTS jobs_batch ON jobs (batch, seq)"
+
+
+_ADDED_COLUMNS = (("stage", "TEXT"), ("pages_done", "INTEGER"), ("pages_total", "INTEGER"),
+                  ("eta_seconds", "REAL"), ("cost_seconds", "REAL"), ("mem_mb", "REAL"), ("cpu", "REAL"),
+                  ("cancel_requested", "REAL"), ("batch", "TEXT"), ("name", "TEXT"))
+
+
+def _column(field):
+    return "in_name" if field == "in" else field
+
+
+class SQLiteJobStore:
+    """
+    JobStore kept in a SQLite database, so every web and worker process that opens the
+    same file sees the same jobs and queue. Single host only: the database runs in WAL
+    mode, whose shared-memory index does not work over network filesystems (NFS, SMB).
+    Claims run in an immediate transaction, so exactly one worker gets each job; a job
+    whose worker stops renewing its lease is handed to the next worker that asks.
+    """
+
+    def __init__(self, path, ttl=86400, max_entries=10000, aging=1.0):
+        self.path = path
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.aging = aging
+        self.evicted = {"ttl": 0, "cap": 0}
+        self._local = threading.local()
+        with self._db() as db:
+            db.executescript(_SCHEMA)
+            # databases created by an older version lack the newer columns
+            have = {row["name"] for row in db.execute("PRAGMA table_info(jobs)")}
+            for name, decl in _ADDED_COLUMNS:
+                if name not in have:
+                    db.execute("ALTER TABLE jobs ADD COLUMN %s %s" % (name, decl))
+            db.execute(_BATCH_INDEX)
+
+    def _db(self):
+        # one connection per thread; autocommit, with explicit transactions where needed
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def _row(self, row):
+        rec = {f: row[_column(f)] for f in _FIELDS}
+        for f in _JSON_FIELDS:
+            rec[f] = json.loads(rec[f]) if rec[f] else None
+        return rec
+
+    def __contains__(self, job_id):
+        return self._db().execute("SELECT 1 FROM jobs WHERE id = ?", (job_id,)).fetchone() is not None
+
+    def add(self, job_id, record):
+        record = dict(record, created=time.time())
+        fields = [f for f in _FIELDS if f in record]
+        values = [json.dumps(record[f]) if f in _JSON_FIELDS else record[f] for f in fields]
+        self._db().execute("INSERT OR REPLACE INTO jobs (id, %s) VALUES (?%s)" % (
+            ", ".join(_column(f) for f in fields), ", ?" * len(fields)), [job_id] + values)
+        self._enforce_cap()
+
+    def get(self, job_id):
+        row = self._db().execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return self._row(row) if row is not None else None
+
+    def update(self, job_id, **fields):
+        if not fields:
+            return
+        values = [json.dumps(v) if f in _JSON_FIELDS else v for f, v in fields.items()]
+        self._db().execute("UPDATE jobs SET %s WHERE id = ?" % ", ".join("%s = ?" % _column(f) for f in fields),
+                           values + [job_id])
+
+    def pop(self, job_id):
+        rec = self.get(job_id)
+        self._db().execute("DELETE FROM jobs WHERE id = ?", (job_id,))
+        return rec
+
+    def finish(self, job_id):
+        self.update(job_id, finished=time.time())
+
+    def cancel(self, job_id, message):
+        now = time.time()
+        db = self._db()
+        db.execute("BEGIN IMMEDIATE")
+        try:
+            row = db.execute("SELECT status FROM jobs WHERE id = ?", (job_id,)).fetchone()
+            status = row["status"] if row is not None else None
+            if status in ("queued", "waiting"):
+                db.execute("UPDATE jobs SET status = 'cancelled', error = ?, progress = 0, finished = ? "
+                           "WHERE id = ?", (message, now, job_id))
+                status = "cancelled"
+            elif status == "processing":
+                db.execute("UPDATE jobs SET cancel_requested = ? WHERE id = ?", (now, job_id))
+                status = "cancelling"
+            db.execute("COMMIT")
+        except Exception:
+            db.execute("ROLLBACK")
+            raise
+        return status
+
+    def find_active(self, key):
+        row = self._db().execute("SELECT id FROM jobs WHERE key = ? AND status NOT IN " + _FINISHED_SQL +
+                                 " ORDER BY seq LIMIT 1", (key,)).fetchone()
+        return row["id"] if row is not None else None
+
+    def batch(self, batch_id):
+        rows = self._db().execute("SELECT * FROM jobs WHERE batch = ? ORDER BY seq", (batch_id,))
+        return [(row["id"], self._row(row)) for row in rows]
+
+    # --- queue ---
+    def claim(self, owner, lease, budget=None):
+        now = time.time()
+        db = self._db()
+        db.execute("BEGIN IMMEDIATE")
+        try:
+            while True:
+                # the queue is bounded (JobScheduler.max_queue), so ordering it here is cheap
+                rows = db.execute("SELECT id, attempts, created, cost_seconds, mem_mb, cpu FROM jobs "
+                                  "WHERE status = 'queued' OR (status = 'processing' AND lease_expires < ?) "
+                                  "ORDER BY seq", (now,)).fetchall()
+                if not rows:
+                    job_id = None
+                    break
+                row = min(rows, key=lambda r: _priority(dict(r), now, self.aging))
+                if row["attempts"] >= MAX_ATTEMPTS:
+                    db.execute("UPDATE jobs SET status = 'error', error = ?, progress = 0, finished = ?, "
+                               "lease_owner = NULL WHERE id = ?", (_CRASHED, now, row["id"]))
+                    continue
+                running = [dict(r) for r in db.execute(
+                    "SELECT mem_mb, cpu FROM jobs WHERE status = 'processing' AND lease_expires >= ?", (now,))]
+                if not _fits(dict(row), running, budget):
+                    job_id = None
+                    break
+                job_id = row["id"]
+                db.execute("UPDATE jobs SET status = 'processing', lease_owner = ?, lease_expires = ?, "
+                           "attempts = attempts + 1 WHERE id = ?", (owner, now + lease, job_id))
+                break
+            db.execute("COMMIT")
+        except Exception:
+            db.execute("ROLLBACK")
+            raise
+        return job_id
+
+    def renew(self, job_ids, owner, lease):
+        lost = []
+        db = self._db()
+        for job_id in job_ids:
+            cur = db.execute("UPDATE jobs SET lease_expires = ? WHERE id = ? AND lease_owner = ?",
+                             (time.time() + lease, job_id, owner))
+            if cur.rowcount == 0:
+                lost.append(job_id)
+        return lost
+
+    def release(self, job_id, owner):
+        self._db().execute("UPDATE jobs SET lease_owner = NULL WHERE id = ? AND lease_owner = ?", (job_id, owner))
+
+    def position(self, job_id):
+        now = time.time()
+        rows = self._db().execute("SELECT id, created, cost_seconds FROM jobs WHERE status = 'queued' "
+                                  "ORDER BY seq").fetchall()
+        order = sorted(rows, key=lambda r: _priority(dict(r), now, self.aging))
+        for pos, row in enumerate(order, start=1):
+            if row["id"] == job_id:
+                return pos
+        return None
+
+    def queued(self):
+        return self._db().execute("SELECT COUNT(*) FROM jobs WHERE status = 'queued'").fetchone()[0]
+
+    def waiting(self):
+        return self._db().execute("SELECT COUNT(*) FROM jobs WHERE status = 'waiting'").fetchone()[0]
+
+    def admit(self, max_queue):
+        db = self._db()
+        # every idle worker calls this on each poll: skip the write lock when nothing waits
+        if db.execute("SELECT 1 FROM jobs WHERE status = 'waiting' LIMIT 1").fetchone() is None:
+            return 0
+        db.execute("BEGIN IMMEDIATE")
+        try:
+            room = max_queue - db.execute("SELECT COUNT(*) FROM jobs WHERE status = 'queued'").fetchone()[0]
+            moved = 0
+            if room > 0:
+                moved = db.execute("UPDATE jobs SET status = 'queued' WHERE id IN "
+                                   "(SELECT id FROM jobs WHERE status = 'waiting' ORDER BY seq LIMIT ?)",
+                                   (room,)).rowcount
+            db.execute("COMMIT")
+        except Exception:
+            db.execute("ROLLBACK")
+            raise
+        return moved
+
+    # --- retention ---
+    def referenced_files(self):
+        names = set()
+        for row in self._db().execute("SELECT in_name, out FROM jobs"):
+            names.update(n for n in row if n)
+        return names
+
+    def expire(self, now=None):
+        now = time.time() if now is None else now
+        cur = self._db().execute("DELETE FROM jobs WHERE finished IS NOT NULL AND finished < ?", (now - self.ttl,))
+        _count_evicted(self, "ttl", cur.rowcount)
+        return cur.rowcount
+
+    def stats(self):
+        db = self._db()
+        records = db.execute("SELECT COUNT(*) FROM jobs").fetchone()[0]
+        active = db.execute("SELECT COUNT(*) FROM jobs WHERE status NOT IN " + _FINISHED_SQL).fetchone()[0]
+        return {"records": records, "active": active, "max_entries": self.max_entries,
+                "evicted": dict(self.evicted)}
+
+    def _enforce_cap(self):
+        db = self._db()
+        excess = db.execute("SELECT COUNT(*) FROM jobs").fetchone()[0] - self.max_entries
+        if excess > 0:
+            cur = db.execute("DELETE FROM jobs WHERE id IN (SELECT id FROM jobs WHERE finished IS NOT NULL "
+                             "ORDER BY seq LIMIT ?)", (excess,))
+            _count_evicted(self, "cap", cur.rowcount)
+
+
+class Janitor:
+    """
+    Background thread that deletes job files (<job id>.pdf / .docx, see JOB_FILE) nobody
+    needs any more; anything else in the directories, such as convert.py's batch output,
+    is left alone and does not count against the budget:
+      - files older than `ttl` seconds that no job record and no `keep()` name references,
+      - then, while a directory is over `budget_bytes`, the oldest of those files.
+    Each directory is (path, budget_bytes); budget None means TTL only. Started lazily.
+    """
+
+    def __init__(self, store, directories, ttl=86400, interval=300, keep=None):
+        self.store = store
+        self.directories = directories
+        self.ttl = ttl
+        self.interval = interval
+        self.keep = keep                   # callable -> extra file names to spare (e.g. the result cache)
+        self.removed = {"files": 0, "bytes": 0}
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def start(self):
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._loop, name="janitor", daemon=True)
+                self._thread.start()
+
+    def sweep(self, now=None):
+        """One pass over every directory; returns (files, bytes) removed."""
+        now = time.time() if now is None else now
+        self.store.expire(now)
+        referenced = self.store.referenced_files()
+        keep = set(self.keep()) if self.keep else set()
+        files = size = 0
+        for directory, budget in self.directories:
+            f, b = self._sweep_dir(directory, budget, referenced, keep, now)
+            files += f
+            size += b
+        return files, size
+
+    def _loop(self):
+        while True:
+            time.sleep(self.interval)
+            try:
+                self.sweep()
+            except Exception as e:
+                print("janitor sweep failed:", e)
+
+    def _sweep_dir(self, directory, budget, referenced, keep, now):
+        entries = []
+        try:
+            with os.scandir(directory) as it:
+                for entry in it:
+                    if JOB_FILE.match(entry.name) and entry.is_file():
+                        st = entry.stat()
+                        entries.append((st.st_mtime, st.st_size, entry.name))
+        except OSError:
+            return 0, 0
+        entries.sort()
+        total = sum(size for _, size, _ in entries)
+        files = freed = 0
+        for mtime, size, name in entries:
+            if name in referenced or name in keep:
+                continue
+            expired = now - mtime > self.ttl
+            over_budget = budget is not None and total > budget
+            if not (expired or over_budget):
+                continue
+            try:
+                os.remove(os.path.join(directory, name))
+            except OSError:
+                continue
+            total -= size
+            files += 1
+            freed += size
+        if files:
+            self.removed["files"] += files
+            self.removed["bytes"] += freed
+            label = os.path.basename(os.path.normpath(directory))
+            metrics.registry.inc("janitor_files_removed_total", label, files, label_name="dir")
+            metrics.registry.inc("janitor_bytes_removed_total", label, freed, label_name="dir")
+        return files, freed
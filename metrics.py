@@ -0,0 +1,202 @@
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+try:
+    import resource
+except ImportError:      # Windows
+    resource = None
+
+# Histogram buckets: seconds for timings, MB for memory
+BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600, float("inf"))
+RSS_BUCKETS_MB = (128, 256, 512, 1024, 2048, 4096, 8192, float("inf"))
+# how often the memory of open stages is sampled
+RSS_SAMPLE_SECONDS = 0.2
+
+_local = threading.local()
+
+
+def _cpu_seconds():
+    # the calling thread (not the other jobs of a thread-mode server), plus finished
+    # children (ocrmypdf/tesseract helpers); those are counted process-wide
+    cpu = time.thread_time()
+    if resource is not None:
+        kids = resource.getrusage(resource.RUSAGE_CHILDREN)
+        cpu += kids.ru_utime + kids.ru_stime
+    return cpu
+
+
+def current_rss_mb():
+    """Resident memory of this process right now; 0 where it cannot be read."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / (1024.0 * 1024.0)
+    except (OSError, ValueError, AttributeError):
+        pass
+    try:
+        import psutil
+        return psutil.Process().memory_info().rss / (1024.0 * 1024.0)
+    except Exception:
+        return 0.0
+
+
+# spans still running, by id(); a sampler thread raises their peak_rss_mb
+_open_spans = {}
+_open_lock = threading.Lock()
+_sampler = None
+
+
+def _sample_rss():
+    while True:
+        time.sleep(RSS_SAMPLE_SECONDS)
+        with _open_lock:
+            spans = list(_open_spans.values())
+        if spans:
+            _raise_peak(spans, current_rss_mb())
+
+
+def _raise_peak(spans, rss):
+    for span in spans:
+        if rss > span["peak_rss_mb"]:
+            span["peak_rss_mb"] = rss
+
+
+def _track(span):
+    global _sampler
+    with _open_lock:
+        _open_spans[id(span)] = span
+        if _sampler is None:
+            _sampler = threading.Thread(target=_sample_rss, name="rss-sampler", daemon=True)
+            _sampler.start()
+
+
+def _untrack(span):
+    with _open_lock:
+        _open_spans.pop(id(span), None)
+
+
+# --- per-job traces (one per thread) ---
+def begin_trace(scope="process"):
+    """
+    Start recording this thread's spans. scope says whose CPU time and memory they
+    measure: "job" where the process runs nothing but this job (a converter process),
+    "process" where other jobs may share it (thread executor, the web process).
+    """
+    _local.spans = []
+    _local.scope = scope
+
+
+def end_trace():
+    spans = getattr(_local, "spans", None) or []
+    _local.spans = None
+    return spans
+
+
+def add_spans(spans):
+    """Attach spans recorded elsewhere (e.g. in a converter process) to this thread's trace."""
+    current = getattr(_local, "spans", None)
+    if current is not None:
+        current.extend(spans)
+
+
+@contextmanager
+def stage(name, pages=None):
+    """
+    Time one pipeline stage; the yielded dict may be updated (e.g. span["pages"] = n).
+    Recorded only while a trace is active on the calling thread. peak_rss_mb is the
+    largest resident size sampled while the stage ran, not the process's lifetime peak.
+    Both it and the children's part of cpu_s cover the whole process; span["scope"]
+    (from begin_trace) says whether that process ran only this job.
+    """
+    span = {"stage": name, "pages": pages, "scope": getattr(_local, "scope", None) or "process",
+            "peak_rss_mb": current_rss_mb()}
+    wall0, cpu0 = time.perf_counter(), _cpu_seconds()
+    _track(span)
+    try:
+        yield span
+    finally:
+        _untrack(span)
+        _raise_peak([span], current_rss_mb())
+        span["wall_s"] = round(time.perf_counter() - wall0, 4)
+        span["cpu_s"] = round(_cpu_seconds() - cpu0, 4)
+        span["peak_rss_mb"] = round(span["peak_rss_mb"], 1)
+        current = getattr(_local, "spans", None)
+        if current is not None:
+            current.append(span)
+
+
+# --- process-wide histograms ---
+class Histogram:
+    def __init__(self, buckets=BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.total = 0.0
+        self.n = 0
+
+    def observe(self, value):
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+        self.total += value
+        self.n += 1
+
+
+class Registry:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._hists = {}      # (metric, label value) -> Histogram
+        self._counters = {}   # (metric, label value) -> float
+        self._labels = {}     # metric -> label name
+
+    def observe(self, metric, label, value, label_name="stage", buckets=BUCKETS):
+        with self._lock:
+            self._labels[metric] = label_name
+            self._hists.setdefault((metric, label), Histogram(buckets)).observe(value)
+
+    def inc(self, metric, label, amount=1, label_name="stage"):
+        with self._lock:
+            self._labels[metric] = label_name
+            self._counters[(metric, label)] = self._counters.get((metric, label), 0) + amount
+
+    def observe_job(self, spans, seconds, status):
+        self.observe("convert_job_seconds", status, seconds, label_name="status")
+        for span in spans:
+            self.observe("convert_stage_seconds", span["stage"], span["wall_s"])
+            # CPU and memory per stage only where they belong to one job (converter
+            # processes); in a shared process they would mix in the other jobs
+            if span.get("scope") == "job":
+                self.observe("convert_stage_cpu_seconds", span["stage"], span["cpu_s"])
+                self.observe("convert_stage_peak_rss_mb", span["stage"], span["peak_rss_mb"],
+                             buckets=RSS_BUCKETS_MB)
+            self.inc("convert_stage_pages_total", span["stage"], span.get("pages") or 0)
+            for result in ("hits", "misses"):
+                if span.get("ocr_cache_" + result):
+                    self.inc("ocr_cache_lookups_total", result, span["ocr_cache_" + result], label_name="result")
+            if "bytes_before" in span:
+                self.inc("docx_image_bytes_saved_total", span["stage"], span["bytes_before"] - span["bytes_after"])
+
+    def render(self):
+        """Prometheus text exposition format."""
+        lines = []
+        with self._lock:
+            seen = set()
+            for (metric, label), h in sorted(self._hists.items()):
+                if metric not in seen:
+                    lines.append("# TYPE %s histogram" % metric)
+                    seen.add(metric)
+                name = self._labels[metric]
+                for bound, count in zip(h.buckets, h.counts):
+                    le = "+Inf" if bound == float("inf") else repr(bound)
+                    lines.append('%s_bucket{%s="%s",le="%s"} %d' % (metric, name, label, le, count))
+                lines.append('%s_sum{%s="%s"} %.4f' % (metric, name, label, h.total))
+                lines.append('%s_count{%s="%s"} %d' % (metric, name, label, h.n))
+            for (metric, label), value in sorted(self._counters.items()):
+                if metric not in seen:
+                    lines.append("# TYPE %s counter" % metric)
+                    seen.add(metric)
+                lines.append('%s{%s="%s"} %s' % (metric, self._labels[metric], label, value))
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
@@ -0,0 +1,130 @@
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+
+
+def page_key(img, lang="eng", config=""):
+    """Key for one page's OCR: the grayscale bitmap plus every setting that changes tesseract's output."""
+    gray = img if img.mode == "L" else img.convert("L")
+    h = hashlib.sha256()
+    h.update(("tesseract|%s|%s|%dx%d|" % (lang, config, gray.width, gray.height)).encode("utf-8"))
+    h.update(gray.tobytes())
+    return h.hexdigest()
+
+
+class PageOCRCache:
+    """
+    OCR text of page images, so a page seen before (forms, letterhead) skips tesseract.
+    The most recently used `max_entries` texts are kept in memory; every text is also
+    written to `directory`, where files not read for longest are deleted once they take
+    more than `max_bytes`. Processes sharing the directory share the disk layer.
+    """
+
+    def __init__(self, directory, max_entries=512, max_bytes=256 * 1024 * 1024):
+        self.directory = directory
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._memory = OrderedDict()   # key -> text
+        self._disk_bytes = None        # measured on first write
+        self.hits = {"memory": 0, "disk": 0}
+        self.misses = 0
+
+    @property
+    def enabled(self):
+        return self.max_entries > 0 or self.max_bytes > 0
+
+    def get(self, key):
+        """Cached text for key, or None."""
+        with self._lock:
+            text = self._memory.get(key)
+            if text is not None:
+                self._memory.move_to_end(key)
+                self.hits["memory"] += 1
+                return text
+        path = self._path(key)
+        try:
+            with open(path, encoding="utf-8") as f:
+                text = f.read()
+            os.utime(path)   # mtime is the disk layer's LRU clock
+        except OSError:
+            with self._lock:
+                self.misses += 1
+            return None
+        with self._lock:
+            self.hits["disk"] += 1
+            self._remember(key, text)
+        return text
+
+    def put(self, key, text):
+        with self._lock:
+            self._remember(key, text)
+        if self.max_bytes <= 0:
+            return
+        path = self._path(key)
+        tmp = "%s.%d.tmp" % (path, threading.get_ident())
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(tmp, "w", encoding="utf-8") as f:
+                f.write(text)
+            os.replace(tmp, path)
+            size = os.path.getsize(path)
+        except OSError as e:
+            print("OCR cache entry not saved:", e)
+            return
+        with self._lock:
+            if self._disk_bytes is None:
+                self._disk_bytes = self._measure()[1]
+            else:
+                self._disk_bytes += size
+            if self._disk_bytes > self.max_bytes:
+                self._evict_disk()
+
+    def stats(self):
+        with self._lock:
+            return {
+                "memory_entries": len(self._memory),
+                "hits_memory": self.hits["memory"],
+                "hits_disk": self.hits["disk"],
+                "misses": self.misses,
+            }
+
+    # --- internals ---
+    def _path(self, key):
+        return os.path.join(self.directory, key[:2], key + ".txt")
+
+    def _remember(self, key, text):
+        if self.max_entries <= 0:
+            return
+        self._memory[key] = text
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+
+    def _measure(self):
+        files, total = [], 0
+        for root, _, names in os.walk(self.directory):
+            for name in names:
+                if not name.endswith(".txt"):
+                    continue
+                try:
+                    st = os.stat(os.path.join(root, name))
+                except OSError:
+                    continue
+                files.append((st.st_mtime_ns, st.st_size, os.path.join(root, name)))
+                total += st.st_size
+        return files, total
+
+    def _evict_disk(self):
+        # down to 90% of the budget, so the walk is not repeated on every write
+        files, total = self._measure()
+        for _, size, path in sorted(files):
+            if total <= self.max_bytes * 0.9:
+                break
+            try:
+                os.remove(path)
+                total -= size
+            except OSError:
+                pass
+        self._disk_bytes = total
@@ -0,0 +1,165 @@
+import os
+import subprocess
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+TESSERACT_CMD = "tesseract"
+
+# tesseract processes allowed at once in this process, whatever the number of jobs;
+# each one is pinned to a single thread, so this is the number of cores OCR uses
+CPU_BUDGET = int(os.environ.get("CPU_BUDGET") or os.cpu_count() or 1)
+_slots = threading.BoundedSemaphore(max(1, CPU_BUDGET))
+
+
+class _Processes:
+    """The tesseract processes started for one BatchOCR; kill() ends them and refuses new ones."""
+
+    def __init__(self):
+        self.killed = False
+        self._procs = set()
+        self._lock = threading.Lock()
+
+    def start(self, args, env):
+        with self._lock:
+            if self.killed:
+                raise RuntimeError("tesseract run cancelled")
+            proc = subprocess.Popen(args, env=env, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+            self._procs.add(proc)
+            return proc
+
+    def done(self, proc):
+        with self._lock:
+            self._procs.discard(proc)
+
+    def kill(self):
+        with self._lock:
+            self.killed = True
+            for proc in self._procs:
+                try:
+                    proc.kill()
+                except OSError:
+                    pass
+
+
+def _run(args, cmd, procs=None):
+    env = dict(os.environ, OMP_THREAD_LIMIT="1")
+    procs = procs or _Processes()
+    with _slots:
+        proc = procs.start([cmd or TESSERACT_CMD] + args, env)
+        try:
+            out, err = proc.communicate()
+        finally:
+            procs.done(proc)
+    if procs.killed:
+        raise RuntimeError("tesseract run cancelled")
+    if proc.returncode != 0:
+        raise RuntimeError("tesseract failed: " + err.decode("utf-8", "replace").strip()[-500:])
+    return out.decode("utf-8", "replace")
+
+
+def ocr_files(paths, lang="eng", config="", cmd=None, procs=None):
+    """
+    Text of each image file, from one tesseract process: the images are passed as a
+    file list, so the process starts and loads its traineddata once per batch.
+    `procs` (a BatchOCR's _Processes) lets the caller kill the run.
+    """
+    if not paths:
+        return []
+    list_path = paths[0] + ".list"
+    with open(list_path, "w", encoding="utf-8") as f:
+        f.write("\n".join(paths) + "\n")
+    try:
+        out = _run([list_path, "stdout", "-l", lang] + config.split(), cmd, procs)
+    finally:
+        os.remove(list_path)
+    # the text renderer ends every page with a form feed
+    texts = out.split("\f")
+    if len(texts) == len(paths) + 1 and not texts[-1].strip():
+        return texts[:-1]
+    # page count does not line up (e.g. a custom page_separator): one process per image
+    return [_run([p, "stdout", "-l", lang] + config.split(), cmd, procs) for p in paths]
+
+
+class BatchOCR:
+    """
+    Collects page images and OCRs them `batch_size` at a time, with up to `jobs`
+    tesseract batches running in parallel. Images are written to `workdir` as they
+    are added, so only the pending batch's file names stay in memory. Leaving the `with`
+    block early (an error, a stopped job) kills the batches still running.
+
+        with BatchOCR(workdir, jobs=2) as batch:
+            for n, img in pages:
+                batch.add(n, img)
+            texts = batch.finish()      # {page: text}
+    """
+
+    def __init__(self, workdir, lang="eng", config="", batch_size=8, jobs=1, cmd=None, on_page=None):
+        self.workdir = workdir
+        self.lang = lang
+        self.config = config
+        self.batch_size = max(1, batch_size)
+        self.cmd = cmd
+        self.jobs = max(1, jobs)
+        self.on_page = on_page       # on_page(pages done), called from the thread using the batch
+        self.texts = {}
+        self._pending = []           # [(page, image path)]
+        self._running = {}           # future -> [(page, image path)]
+        self._pool = ThreadPoolExecutor(max_workers=self.jobs, thread_name_prefix="tesseract")
+        self._procs = _Processes()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def add(self, page, img):
+        path = os.path.join(self.workdir, "page-%05d.png" % page)
+        # tesseract works on grayscale anyway; a light PNG keeps writing fast
+        (img if img.mode == "L" else img.convert("L")).save(path, compress_level=1)
+        self._pending.append((page, path))
+        if len(self._pending) >= self.batch_size:
+            self._submit()
+        self._collect(block=False)
+        # rendering outpaces OCR: wait instead of piling up page images on disk
+        while len(self._running) > self.jobs:
+            self._collect(block=True)
+
+    def finish(self):
+        """Wait for every batch and return {page: text}."""
+        try:
+            self._submit()
+            while self._running:
+                self._collect(block=True)
+        finally:
+            self._pool.shutdown(wait=True)
+        return self.texts
+
+    def close(self):
+        """Drop the queued batches and kill the running tesseract processes (no-op after finish())."""
+        self._procs.kill()
+        self._pool.shutdown(wait=True, cancel_futures=True)
+
+    # --- internals ---
+    def _submit(self):
+        if not self._pending:
+            return
+        batch, self._pending = self._pending, []
+        fut = self._pool.submit(ocr_files, [p for _, p in batch], self.lang, self.config, self.cmd, self._procs)
+        self._running[fut] = batch
+
+    def _collect(self, block):
+        if not self._running:
+            return
+        done, _ = wait(list(self._running), timeout=None if block else 0, return_when=FIRST_COMPLETED)
+        for fut in done:
+            batch = self._running.pop(fut)
+            for path in (p for _, p in batch):
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+            for (page, _), text in zip(batch, fut.result()):
+                self.texts[page] = text
+            if self.on_page:
+                self.on_page(len(self.texts))
@@ -0,0 +1,41 @@
+"""
+ocrmypdf plugin that forwards its per-page progress to `callback(stage, done, total)`.
+convert_all_in_one sets `callback` around each ocrmypdf.ocr() call while holding its
+_ocr_lock, so with several jobs on threads of one process the callback always belongs
+to the job whose OCR is running.
+"""
+import threading
+
+from ocrmypdf import hookimpl
+
+callback = None
+
+
+class PageProgress:
+    """Stands in for ocrmypdf's progress bar (same constructor and update() signature)."""
+
+    def __init__(self, *, total=None, desc=None, unit=None, disable=False, **kwargs):
+        self.total = total
+        self.unit = unit
+        self.done = 0
+        self._lock = threading.Lock()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def update(self, n=1, *, completed=None):
+        with self._lock:
+            self.done = completed if completed is not None else self.done + n
+            done = self.done
+        cb = callback
+        # only the per-page stage; ocrmypdf also reports e.g. optimization in other units
+        if cb is not None and self.unit == "page" and self.total:
+            cb("ocr", min(int(done), int(self.total)), int(self.total))
+
+
+@hookimpl
+def get_progressbar_class():
+    return PageProgress
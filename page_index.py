@@ -0,0 +1,117 @@
+import os
+import threading
+from collections import OrderedDict
+
+# a page needs OCR when its text layer has fewer visible characters than this ...
+MIN_TEXT_CHARS = int(os.environ.get("MIN_TEXT_CHARS") or 25)
+# ... or when a page-sized image covers it and only a few words sit on top (stamps, headers)
+SCAN_IMAGE_COVERAGE = 0.85
+SCAN_MAX_OVERLAY_CHARS = 200
+
+_memo = OrderedDict()   # (path, mtime, size) -> index
+_memo_lock = threading.Lock()
+_MEMO_SIZE = 8
+
+
+def visible_chars(text):
+    """Characters of text that are not whitespace."""
+    return sum(1 for c in text if not c.isspace())
+
+
+def image_coverage(page):
+    """Share (0..1) of a PyMuPDF page covered by placed images."""
+    area = float(page.rect.width * page.rect.height) or 1.0
+    covered = 0.0
+    for img in page.get_image_info():
+        r = page.rect & img["bbox"]
+        if not r.is_empty:
+            covered += r.width * r.height
+    return min(1.0, covered / area)
+
+
+def is_scanned(page, chars=None, coverage=None):
+    """
+    Whether a PyMuPDF page needs OCR: (almost) no text layer, or a page-sized image with
+    only a few words on top. chars / coverage are computed when not passed in.
+    """
+    if chars is None:
+        chars = visible_chars(page.get_text("text"))
+    if chars < MIN_TEXT_CHARS:
+        return True
+    if chars >= SCAN_MAX_OVERLAY_CHARS:
+        return False
+    return (image_coverage(page) if coverage is None else coverage) >= SCAN_IMAGE_COVERAGE
+
+
+def _table_candidate(page):
+    # ruled tables: enough drawn lines/boxes to form a grid
+    segments = 0
+    for path in page.get_cdrawings():
+        segments += sum(1 for item in path.get("items", ()) if item[0] in ("l", "re", "qu"))
+        if segments >= 4:
+            return True
+    # borderless tables: several text rows split into 3+ columns by wide gaps
+    rows = {}
+    for x0, y0, x1, y1, *_ in page.get_text("words"):
+        rows.setdefault(round(y0), []).append((x0, x1, y1 - y0))
+    gapped = 0
+    for row in rows.values():
+        row.sort()
+        # a word box is about 1.2 font sizes high: wider than ~2 font sizes is a column gap
+        gaps = sum(1 for a, b in zip(row, row[1:]) if b[0] - a[1] > 1.6 * (a[2] or 10))
+        if gaps >= 2:
+            gapped += 1
+            if gapped >= 3:
+                return True
+    return False
+
+
+def _classify(page):
+    chars = visible_chars(page.get_text("text"))
+    coverage = image_coverage(page)
+    scanned = is_scanned(page, chars, coverage)
+    return {
+        "page": page.number + 1,
+        "chars": chars,
+        "image_coverage": round(coverage, 3),
+        "scanned": scanned,
+        "table_candidate": not scanned and _table_candidate(page),
+    }
+
+
+def build_page_index(pdf_path):
+    """
+    Single PyMuPDF pass over the PDF returning one record per page:
+        {"page": 1-based number, "chars": visible text-layer chars,
+         "image_coverage": 0..1, "scanned": needs OCR,
+         "table_candidate": ruling lines or column-aligned text worth a table pass}
+    Results are memoized per file version, so every stage of a job shares one pass.
+    """
+    st = os.stat(pdf_path)
+    memo_key = (os.path.abspath(pdf_path), st.st_mtime_ns, st.st_size)
+    with _memo_lock:
+        if memo_key in _memo:
+            _memo.move_to_end(memo_key)
+            return _memo[memo_key]
+
+    import fitz
+    with fitz.open(pdf_path) as pdf:
+        index = [_classify(page) for page in pdf]
+
+    with _memo_lock:
+        _memo[memo_key] = index
+        while len(_memo) > _MEMO_SIZE:
+            _memo.popitem(last=False)
+    return index
+
+
+def scanned_pages(index):
+    return [p["page"] for p in index if p["scanned"]]
+
+
+def text_pages(index):
+    return [p["page"] for p in index if not p["scanned"]]
+
+
+def table_pages(index):
+    return [p["page"] for p in index if p.get("table_candidate", not p["scanned"])]
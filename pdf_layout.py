@@ -0,0 +1,127 @@
+import math
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from docx import Document
+
+# Documents with at least LAYOUT_CHUNK_MIN_PAGES pages are parsed in page-range chunks
+# spread over LAYOUT_JOBS processes; LAYOUT_JOBS=1 keeps the single-process path.
+# app.py defaults it to each job's share of CPU_BUDGET; standalone it is the CPU count.
+LAYOUT_JOBS = int(os.environ.get("LAYOUT_JOBS") or os.cpu_count() or 1)
+LAYOUT_CHUNK_MIN_PAGES = int(os.environ.get("LAYOUT_CHUNK_MIN_PAGES") or 40)
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def _get_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ProcessPoolExecutor(max_workers=LAYOUT_JOBS, mp_context=multiprocessing.get_context("spawn"))
+        return _pool
+
+
+def _drop_pool(pool):
+    # a worker died (crash, OOM kill): the executor refuses all further work, so the next
+    # chunked document gets a fresh one instead of the single-process fallback
+    global _pool
+    with _pool_lock:
+        if _pool is pool:
+            _pool = None
+    pool.shutdown(wait=False, cancel_futures=True)
+
+
+def parse_chunk(pdf_path, start, end):
+    """Parse pages [start, end) with pdf2docx and return the parsed layout (runs in a pool process)."""
+    from pdf2docx import Converter
+    cv = Converter(pdf_path)
+    try:
+        settings = cv.default_settings
+        cv.parse(start, end, **settings)
+        return cv.store()
+    finally:
+        cv.close()
+
+
+def parse_pages(cv, settings, pages=None, progress=None):
+    """
+    Converter.parse() split into its steps so each parsed page can be reported as
+    progress("layout", done, total); pages are 0-based, None means all.
+    """
+    cv.load_pages(pages=pages)
+    cv.parse_document(**settings)
+    todo = [page for page in cv.pages if not page.skip_parsing]
+    for i, page in enumerate(todo, start=1):
+        try:
+            page.parse(**settings)
+        except Exception as e:
+            if settings.get("debug") or not settings.get("ignore_page_error", True):
+                raise
+            print("layout page", page.id + 1, "skipped:", e)
+        if progress:
+            progress("layout", i, len(todo))
+
+
+def _chunks(num_pages, jobs):
+    # about two chunks per process so a slow range does not leave the others idle
+    size = max(LAYOUT_CHUNK_MIN_PAGES // 4, math.ceil(num_pages / (jobs * 2)), 1)
+    return [(s, min(num_pages, s + size)) for s in range(0, num_pages, size)]
+
+
+def layout_document(pdf_path, jobs=None, progress=None):
+    """
+    pdf2docx layout of the whole PDF as an in-memory python-docx Document (None if nothing
+    was produced). Large documents are parsed in parallel page ranges and the parsed pages
+    are restored into one Converter, so the DOCX is still built by a single make-page pass
+    in page order and keeps pdf2docx's styles and per-page sections intact.
+    progress(stage, done, total) is called per page for "layout" and "docx".
+    """
+    from pdf2docx import Converter
+    jobs = LAYOUT_JOBS if jobs is None else jobs
+    cv = Converter(pdf_path)
+    try:
+        settings = cv.default_settings
+        num_pages = len(cv.fitz_doc)
+        if jobs > 1 and num_pages >= LAYOUT_CHUNK_MIN_PAGES:
+            cv.load_pages()
+            pool = _get_pool()
+            chunks = _chunks(num_pages, jobs)
+            futures = []
+            try:
+                try:
+                    futures = [pool.submit(parse_chunk, pdf_path, s, e) for s, e in chunks]
+                    done = 0
+                    for (s, e), fut in zip(chunks, futures):
+                        cv.restore(fut.result())
+                        done += e - s
+                        if progress:
+                            progress("layout", done, num_pages)
+                finally:
+                    # a failed chunk, or the job stopped from progress(): drop the chunks
+                    # not started yet instead of leaving them to the pool
+                    for fut in futures:
+                        fut.cancel()
+            except Exception as e:
+                if isinstance(e, BrokenProcessPool):
+                    _drop_pool(pool)
+                print("chunked layout failed, parsing in one process:", e)
+                parse_pages(cv, settings, progress=progress)
+        else:
+            parse_pages(cv, settings, progress=progress)
+
+        doc = Document()
+        finalized = [page for page in cv.pages if page.finalized]
+        for i, page in enumerate(finalized, start=1):
+            try:
+                page.make_docx(doc)
+            except Exception:
+                pass
+            if progress:
+                progress("docx", i, len(finalized))
+        return doc if doc.paragraphs or doc.tables else None
+    finally:
+        cv.close()
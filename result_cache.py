@@ -0,0 +1,134 @@
+import hashlib
+import json
+import os
+import threading
+from collections import OrderedDict
+
+
+def file_sha256(path, chunk_size=1024 * 1024):
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(chunk_size), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+def cache_key(content_sha256, options):
+    """Key for one conversion: the input bytes plus every option that changes the output."""
+    blob = content_sha256 + "|" + json.dumps(options or {}, sort_keys=True)
+    return hashlib.sha256(blob.encode("utf-8")).hexdigest()
+
+
+class ResultCache:
+    """
+    Content-addressed cache of finished DOCX files living in the outputs folder.
+    The index is kept in LRU order and persisted as JSON next to the files; once
+    the cached files exceed `max_bytes` the least recently used ones are deleted,
+    except files named by `pinned()` (e.g. the outputs job records still point at,
+    which /download serves); those wait for a later eviction.
+    Several processes may share one cache: the index is reloaded whenever another
+    process has rewritten it.
+    """
+
+    def __init__(self, directory, max_bytes, pinned=None):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.pinned = pinned                # callable -> file names that must not be deleted
+        self.index_path = os.path.join(directory, ".result-cache.json")
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()   # key -> {"file": name, "size": bytes}
+        self._mtime = None              # index file version we last read or wrote
+        self._load()
+
+    @property
+    def enabled(self):
+        return self.max_bytes > 0
+
+    def get(self, key):
+        """Return the cached DOCX file name for key, or None."""
+        if not self.enabled:
+            return None
+        with self._lock:
+            self._refresh()
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if not os.path.exists(os.path.join(self.directory, entry["file"])):
+                del self._entries[key]
+                self._save()
+                return None
+            self._entries.move_to_end(key)
+            return entry["file"]
+
+    def put(self, key, fname):
+        if not self.enabled:
+            return
+        try:
+            size = os.path.getsize(os.path.join(self.directory, fname))
+        except OSError:
+            return
+        with self._lock:
+            self._refresh()
+            self._entries[key] = {"file": fname, "size": size}
+            self._entries.move_to_end(key)
+            self._evict()
+            self._save()
+
+    def files(self):
+        """Names of the DOCX files the cache currently holds."""
+        with self._lock:
+            return {e["file"] for e in self._entries.values()}
+
+    def stats(self):
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "bytes": sum(e["size"] for e in self._entries.values()),
+                "max_bytes": self.max_bytes,
+            }
+
+    # --- internals (called with the lock held) ---
+    def _evict(self):
+        total = sum(e["size"] for e in self._entries.values())
+        if total <= self.max_bytes:
+            return
+        pinned = set(self.pinned()) if self.pinned else set()
+        for key in list(self._entries):     # least recently used first
+            if total <= self.max_bytes or len(self._entries) <= 1:
+                break
+            entry = self._entries[key]
+            if entry["file"] in pinned:
+                continue
+            del self._entries[key]
+            total -= entry["size"]
+            try:
+                os.remove(os.path.join(self.directory, entry["file"]))
+            except OSError:
+                pass
+
+    def _load(self):
+        try:
+            with open(self.index_path, "r", encoding="utf-8") as f:
+                self._mtime = os.fstat(f.fileno()).st_mtime_ns
+                entries = json.load(f)
+        except (OSError, ValueError):
+            return
+        self._entries = OrderedDict((key, entry) for key, entry in entries)
+
+    def _refresh(self):
+        try:
+            mtime = os.stat(self.index_path).st_mtime_ns
+        except OSError:
+            return
+        if mtime != self._mtime:
+            self._load()
+
+    def _save(self):
+        tmp = self.index_path + ".tmp"
+        try:
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump(list(self._entries.items()), f)
+            os.replace(tmp, self.index_path)
+            self._mtime = os.stat(self.index_path).st_mtime_ns
+        except OSError as e:
+            print("result cache index not saved:", e)
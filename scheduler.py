@@ -0,0 +1,153 @@
+import os
+import socket
+import threading
+import time
+
+
+class QueueFull(Exception):
+    """Raised by JobScheduler.submit when the backlog is at its max depth."""
+
+    def __init__(self, retry_after):
+        super().__init__("conversion queue is full")
+        self.retry_after = retry_after
+
+
+class JobScheduler:
+    """
+    Fixed-size pool of conversion workers fed from the queue of a job store
+    (job_store.JobStore in-process, SQLiteJobStore shared between the processes of one host).
+    Each worker claims the next queued job under a lease: the shortest estimate first,
+    and only once it fits the resource `budget` next to the jobs already running
+    ({"mem_mb": .., "cpu": ..}, across every process sharing the store; None for no limit).
+    A heartbeat thread renews
+    the leases of running jobs, so a job whose process dies is picked up again by any
+    other worker once its lease expires. Threads are started lazily on the first
+    submit (or start()), so importing the module that owns the scheduler has no side effects.
+    """
+
+    def __init__(self, handler, store, workers=2, max_queue=20, lease=60, poll_interval=1.0, budget=None,
+                 max_waiting=0):
+        self.handler = handler
+        self.store = store
+        self.budget = budget
+        self.workers = max(0, int(workers))
+        self.max_queue = max(0, int(max_queue))
+        self.max_waiting = max(0, int(max_waiting))   # batch documents held back while the queue is full
+        self.lease = lease
+        self.poll_interval = poll_interval
+        self.owner = "%s:%d" % (socket.gethostname(), os.getpid())
+        self._cond = threading.Condition()
+        self._threads = []
+        self._active = set()               # job ids this process is running
+        self._avg_seconds = None           # moving average of job duration
+
+    def submit(self, job_id, record):
+        """Add the job record (status "queued") to the store, unless the queue is full."""
+        if self.store.queued() >= self.max_queue:
+            raise QueueFull(self.retry_after())
+        self.store.add(job_id, record)
+        with self._cond:
+            self._start_locked()
+            self._cond.notify()
+
+    def submit_many(self, items):
+        """
+        Add several (job_id, record) pairs, e.g. the documents of one batch. As many as the
+        queue has room for are queued; the rest are stored as "waiting" and admitted into
+        the queue as it drains. Either all are added or none (QueueFull), which is the case
+        when the held-back ones would pass max_waiting together with other batches'.
+        """
+        room = max(0, self.max_queue - self.store.queued())
+        if len(items) - room > self.max_waiting - self.store.waiting():
+            raise QueueFull(self.retry_after())
+        for i, (job_id, record) in enumerate(items):
+            self.store.add(job_id, record if i < room else dict(record, status="waiting"))
+        with self._cond:
+            self._start_locked()
+            self._cond.notify_all()
+
+    def start(self):
+        with self._cond:
+            self._start_locked()
+
+    def position(self, job_id):
+        """1-based position of a queued job, or None once it has been picked up."""
+        return self.store.position(job_id)
+
+    def retry_after(self):
+        with self._cond:
+            # a queue slot frees up each time a worker finishes a job
+            avg = self._avg_seconds or 30.0
+            return max(1, int(avg / max(1, self.workers)))
+
+    def stats(self):
+        with self._cond:
+            running = len(self._active)
+        return {
+            "workers": self.workers,
+            "running": running,
+            "queued": self.store.queued(),
+            "max_queue": self.max_queue,
+            "waiting": self.store.waiting(),
+        }
+
+    # --- internals ---
+    def _start_locked(self):
+        if not self.workers or self._threads:
+            return
+        for i in range(self.workers):
+            t = threading.Thread(target=self._loop, name="convert-worker-%d" % i, daemon=True)
+            self._threads.append(t)
+            t.start()
+        t = threading.Thread(target=self._heartbeat, name="convert-heartbeat", daemon=True)
+        self._threads.append(t)
+        t.start()
+
+    def _heartbeat(self):
+        while True:
+            time.sleep(self.lease / 3.0)
+            with self._cond:
+                active = list(self._active)
+            if not active:
+                continue
+            try:
+                for job_id in self.store.renew(active, self.owner, self.lease):
+                    print("lease lost on job", job_id, "- another worker may run it again")
+            except Exception as e:
+                print("lease renewal failed:", e)
+
+    def _loop(self):
+        while True:
+            try:
+                self.store.admit(self.max_queue)
+                job_id = self.store.claim(self.owner, self.lease, self.budget)
+            except Exception as e:
+                print("claiming a job failed:", e)
+                job_id = None
+            if job_id is None:
+                # other processes enqueue too, so poll as well as wait for local submits
+                with self._cond:
+                    self._cond.wait(self.poll_interval)
+                continue
+
+            with self._cond:
+                self._active.add(job_id)
+            t0 = time.monotonic()
+            try:
+                self.handler(job_id)
+            except Exception as e:
+                print("worker crashed on job", job_id, ":", e)
+            finally:
+                elapsed = time.monotonic() - t0
+                with self._cond:
+                    self._active.discard(job_id)
+                    if self._avg_seconds is None:
+                        self._avg_seconds = elapsed
+                    else:
+                        self._avg_seconds = 0.8 * self._avg_seconds + 0.2 * elapsed
+                    # the budget this job held is free again: let idle workers look at the queue
+                    self._cond.notify_all()
+                try:
+                    self.store.release(job_id, self.owner)
+                except Exception as e:
+                    print("releasing job", job_id, "failed:", e)
@@ -1,80 +1,50 @@
-from flask import Flask, request, jsonify, send_file
-import os
-import uuid
-from app import PDFToWordConverter
+"""
+Entry point used by start.bat: the app.py server plus the original /convert and
+/download/<id> routes. A conversion no longer runs inside the request; /convert queues
+a job like /upload and answers 202 with the URLs to follow it.
+"""
+from flask import jsonify, request
+from app import FINISHED, app, jobs, send_output, start_background, upload
+from ingest import UploadRejected
 
-app = Flask(__name__)
-app.config['MAX_CONTENT_LENGTH'] = 50 * 1024 * 1024
-
-UPLOAD_DIR = 'uploads'
-OUTPUT_DIR = 'outputs'
-
-os.makedirs(UPLOAD_DIR, exist_ok=True)
-os.makedirs(OUTPUT_DIR, exist_ok=True)
-
-@app.route('/')
-def serve_index():
-    try:
-        with open('index.html', 'r', encoding='utf-8') as f:
-            return f.read()
-    except:
-        return "HTML file not found", 404
 
 @app.route('/convert', methods=['POST'])
 def convert():
-    if 'file' not in request.files:
-        return jsonify({'error': 'No file uploaded'}), 400
-    
-    file = request.files['file']
-    if file.filename == '':
-        return jsonify({'error': 'No file selected'}), 400
-    
-    if not file.filename.lower().endswith('.pdf'):
-        return jsonify({'error': 'Please upload a PDF file'}), 400
-
-    # Generate unique IDs
-    file_id = str(uuid.uuid4())
-    input_path = os.path.join(UPLOAD_DIR, f"{file_id}.pdf")
-    output_path = os.path.join(OUTPUT_DIR, f"{file_id}.docx")
-    
     try:
-        # Save uploaded file
-        file.save(input_path)
-        
-        # Convert PDF to Word
-        converter = PDFToWordConverter()
-        success = converter.convert_pdf_to_word(input_path, output_path)
-        
-        if success and os.path.exists(output_path):
-            return jsonify({
-                'success': True,
-                'download_url': f'/download/{file_id}',
-                'filename': file.filename.replace('.pdf', '.docx')
-            })
-        else:
-            return jsonify({'error': 'Conversion failed'}), 500
-            
-    except Exception as e:
-        return jsonify({'error': str(e)}), 500
-    finally:
-        # Clean up
-        if os.path.exists(input_path):
-            os.remove(input_path)
+        resp = app.make_response(upload())
+    except UploadRejected as e:
+        return jsonify({'error': str(e)}), e.status
+    if resp.status_code != 200:
+        data = resp.get_json(silent=True) or {}
+        return jsonify({'error': data.get('message') or resp.get_data(as_text=True)}), resp.status_code, \
+            {k: v for k, v in resp.headers.items() if k == 'Retry-After'}
+
+    job_id = resp.get_json()['id']
+    filename = request.files['file'].filename
+    return jsonify({
+        'success': True,
+        'id': job_id,
+        'status_url': f'/status?id={job_id}',
+        'download_url': f'/download/{job_id}',
+        'filename': filename[:-len('.pdf')] + '.docx'
+    }), 202
+
 
 @app.route('/download/<file_id>')
-def download(file_id):
-    output_path = os.path.join(OUTPUT_DIR, f"{file_id}.docx")
-    
-    if os.path.exists(output_path):
-        return send_file(
-            output_path,
-            as_attachment=True,
-            download_name=f"converted_{file_id}.docx"
-        )
-    else:
+def download_job(file_id):
+    job = jobs.get(file_id)
+    if job is None:
         return jsonify({'error': 'File not found'}), 404
+    if job['status'] not in FINISHED:
+        # not converted yet: come back later
+        return jsonify({'status': job['status'], 'progress': job.get('progress') or 0}), 202, {'Retry-After': '5'}
+    if job['status'] != 'done' or not job.get('out'):
+        return jsonify({'error': job.get('error') or 'Conversion failed'}), 500
+    return send_output(job['out'], download_name=f"converted_{file_id}.docx")
+
 
 if __name__ == '__main__':
     print("Starting PDF to Word Converter Server...")
     print("Server running at http://localhost:5000")
+    start_background()
     app.run(host='0.0.0.0', port=5000, debug=True)
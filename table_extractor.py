@@ -0,0 +1,127 @@
+import glob
+import os
+import threading
+
+ROOT = os.path.abspath(os.getcwd())
+TOOLS = os.path.join(ROOT, "tools")
+JAVA_EXE = os.environ.get("JAVA_PATH") or os.path.join(TOOLS, "java", "bin", "java.exe")
+TABULA_JAR = os.environ.get("TABULA_JAR") or os.path.join(TOOLS, "tabula", "tabula.jar")
+
+
+def _jar_path():
+    if os.path.exists(TABULA_JAR):
+        return TABULA_JAR
+    # the tabula-java jar bundled with tabula-py
+    import tabula
+    jars = glob.glob(os.path.join(os.path.dirname(tabula.__file__), "tabula-*-jar-with-dependencies.jar"))
+    if not jars:
+        raise RuntimeError("tabula-java jar not found")
+    return sorted(jars)[-1]
+
+
+class TableSession:
+    """
+    tabula-java running in a JVM that lives as long as this process (via jpype).
+    Starting the JVM happens once; every document after that is loaded once and
+    scanned page by page with lattice first, then stream on pages lattice misses.
+    """
+
+    def __init__(self):
+        import jpype
+        import jpype.imports
+
+        if not jpype.isJVMStarted():
+            if os.path.exists(JAVA_EXE):
+                os.environ.setdefault("JAVA_HOME", os.path.dirname(os.path.dirname(JAVA_EXE)))
+            jpype.addClassPath(_jar_path())
+            jpype.startJVM("-Djava.awt.headless=true", "-Dfile.encoding=UTF8",
+                           "-Dorg.slf4j.simpleLogger.defaultLogLevel=off", convertStrings=False)
+
+        from java.io import File
+        from org.apache.pdfbox.pdmodel import PDDocument
+        from technology.tabula import ObjectExtractor
+        from technology.tabula.detectors import NurminenDetectionAlgorithm
+        from technology.tabula.extractors import BasicExtractionAlgorithm, SpreadsheetExtractionAlgorithm
+
+        self._File = File
+        self._PDDocument = PDDocument
+        self._ObjectExtractor = ObjectExtractor
+        self._detector = NurminenDetectionAlgorithm
+        self._lattice = SpreadsheetExtractionAlgorithm
+        self._stream = BasicExtractionAlgorithm
+
+    def extract(self, pdf_path, pages="all", progress=None):
+        """Return tables (lists of rows of str) found on the given 1-based pages."""
+        tables = []
+        document = self._PDDocument.load(self._File(pdf_path))
+        try:
+            extractor = self._ObjectExtractor(document)
+            if pages == "all":
+                page_iter = extractor.extract()
+                total = document.getNumberOfPages()
+            else:
+                page_iter = (extractor.extract(int(n)) for n in pages)
+                total = len(pages)
+            for done, page in enumerate(page_iter, start=1):
+                found = list(self._lattice().extract(page))
+                if not found:
+                    # borderless: detect table areas first, as tabula's "guess" does
+                    for area in self._detector().detect(page):
+                        found.extend(self._stream().extract(page.getArea(area)))
+                for table in found:
+                    rows = [[str(cell.getText()) for cell in row] for row in table.getRows()]
+                    if rows and any(any(c.strip() for c in row) for row in rows):
+                        tables.append(rows)
+                if progress:
+                    progress("tables", done, total)
+        finally:
+            document.close()
+        return tables
+
+
+_session = None
+_session_error = None      # why the session could not start; not retried in this process
+_session_lock = threading.Lock()
+
+
+def get_session():
+    """
+    The process-wide TableSession, started on first use. If it cannot start (no jpype,
+    no java, jar not found) the error is kept and raised again on every later call.
+    """
+    global _session, _session_error
+    with _session_lock:
+        if _session_error is not None:
+            raise _session_error
+        if _session is None:
+            try:
+                _session = TableSession()
+            except Exception as e:
+                print("tabula JVM session not available, using tabula.read_pdf:", e)
+                _session_error = e
+                raise
+        return _session
+
+
+def extract_tables(pdf_path, pages, progress=None):
+    """
+    Tables on `pages` via the persistent JVM; falls back to one tabula.read_pdf
+    call per method when the JVM session cannot be started.
+    """
+    if not pages:
+        return []
+    try:
+        session = get_session()
+    except Exception:
+        session = None
+    if session is not None:
+        return session.extract(pdf_path, pages, progress)
+
+    import tabula
+    tabula.environment_info.java_path = JAVA_EXE if os.path.exists(JAVA_EXE) else None
+    opts = dict(pages=pages if pages == "all" else list(pages), multiple_tables=True,
+                java_options=["-Djava.awt.headless=true"], pandas_options={"dtype": str})
+    tables = tabula.read_pdf(pdf_path, lattice=True, stream=False, **opts) or []
+    if not tables:
+        tables = tabula.read_pdf(pdf_path, lattice=False, stream=True, **opts) or []
+    return tables
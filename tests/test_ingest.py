@@ -0,0 +1,103 @@
+import os
+
+import pytest
+
+from ingest import IngestFile, PDFProbe, SpooledUpload, UploadRejected
+
+fitz = pytest.importorskip("fitz")
+
+
+def _pdf(pages=1, **save):
+    doc = fitz.open()
+    for _ in range(pages):
+        doc.new_page().insert_text((72, 72), "hello")
+    return doc.tobytes(**save)
+
+
+def _ingest(tmp_path, data, chunk=1000, **limits):
+    f = IngestFile(str(tmp_path), **limits)
+    for i in range(0, len(data), chunk):
+        f.write(data[i:i + chunk])
+    return f.finish()
+
+
+# --- probe, while the bytes arrive ---
+def test_probe_rejects_non_pdf():
+    probe = PDFProbe()
+    with pytest.raises(UploadRejected, match="not a PDF") as e:
+        probe.feed(b"PK\x03\x04" + b"\0" * 2000)
+    assert e.value.status == 400
+
+
+def test_probe_rejects_short_non_pdf_at_the_end():
+    probe = PDFProbe()
+    probe.feed(b"hello")
+    with pytest.raises(UploadRejected, match="not a PDF"):
+        probe.finish()
+
+
+def test_probe_finds_header_after_junk_and_counts_pages():
+    probe = PDFProbe(max_pages=10)
+    data = b"junk\n" + _pdf(3)
+    for i in range(0, len(data), 7):     # tokens split across chunks
+        probe.feed(data[i:i + 7])
+    probe.finish()
+    assert probe.header.startswith(b"%PDF-")
+    assert probe.pages == 3
+
+
+def test_probe_rejects_too_many_pages():
+    with pytest.raises(UploadRejected, match="more than 2 pages") as e:
+        PDFProbe(max_pages=2).feed(_pdf(3))
+    assert e.value.status == 413
+
+
+# --- IngestFile ---
+def test_ingest_stores_and_hashes(tmp_path):
+    import hashlib
+    data = _pdf(2)
+    f = _ingest(tmp_path, data)
+    assert f.pages == 2
+    assert f.sha256 == hashlib.sha256(data).hexdigest()
+    with open(f.path, "rb") as stored:
+        assert stored.read() == data
+
+
+@pytest.mark.parametrize("data, limits, message, status", [
+    (b"not a pdf at all", {}, "not a PDF", 400),
+    (b"%PDF-1.7\ngarbage", {}, "not a readable PDF", 400),
+    (_pdf(1, encryption=fitz.PDF_ENCRYPT_AES_256, user_pw="secret", owner_pw="owner"), {},
+     "password", 400),
+    (_pdf(3), {"max_pages": 2}, "more than 2 pages", 413),
+    (_pdf(1), {"max_bytes": 100}, "larger than", 413),
+])
+def test_ingest_rejects_and_removes_the_file(tmp_path, data, limits, message, status):
+    with pytest.raises(UploadRejected, match=message) as e:
+        _ingest(tmp_path, data, **limits)
+    assert e.value.status == status
+    assert os.listdir(tmp_path) == []
+
+
+def test_discard_removes_the_file(tmp_path):
+    f = _ingest(tmp_path, _pdf(1))
+    f.discard()
+    f.discard()
+    assert os.listdir(tmp_path) == []
+
+
+# --- other file parts ---
+def test_spooled_upload_is_capped():
+    f = SpooledUpload(max_bytes=2 * 1024 * 1024)
+    f.write(b"x" * 1024 * 1024)
+    f.write(b"x" * 1024 * 1024)
+    with pytest.raises(UploadRejected) as e:
+        f.write(b"x")
+    assert e.value.status == 413
+
+
+def test_spooled_upload_reads_back():
+    f = SpooledUpload()
+    f.write(b"abc" * 1000)
+    f.seek(0)
+    assert f.read() == b"abc" * 1000
+    f.close()
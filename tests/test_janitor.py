@@ -0,0 +1,37 @@
+import os
+import uuid
+
+from job_store import Janitor, JobStore
+
+
+def _file(directory, name, size=100, old=False):
+    path = os.path.join(directory, name)
+    with open(path, "wb") as f:
+        f.write(b"x" * size)
+    if old:
+        os.utime(path, (1, 1))
+    return name
+
+
+def test_only_unreferenced_job_files_are_removed(tmp_path):
+    store = JobStore()
+    referenced = _file(tmp_path, str(uuid.uuid4()) + ".docx", old=True)
+    store.add("job", {"status": "done", "out": referenced})
+    expired = _file(tmp_path, str(uuid.uuid4()) + ".pdf", old=True)
+    other = _file(tmp_path, "report.docx", old=True)      # e.g. convert.py output
+
+    assert Janitor(store, [(str(tmp_path), None)], ttl=60).sweep() == (1, 100)
+    assert sorted(os.listdir(tmp_path)) == sorted([referenced, other])
+    assert expired not in os.listdir(tmp_path)
+
+
+def test_kept_files_survive_both_passes(tmp_path):
+    expired_cached = _file(tmp_path, str(uuid.uuid4()) + ".docx", old=True)
+    cached = _file(tmp_path, str(uuid.uuid4()) + ".docx")
+    os.utime(tmp_path / cached, (os.path.getmtime(tmp_path / cached) - 10,) * 2)   # oldest in the TTL
+    newest = _file(tmp_path, str(uuid.uuid4()) + ".docx")
+
+    janitor = Janitor(JobStore(), [(str(tmp_path), 250)], ttl=60, keep=lambda: {expired_cached, cached})
+    assert janitor.sweep() == (1, 100)
+
+    assert sorted(os.listdir(tmp_path)) == sorted([expired_cached, cached])
@@ -0,0 +1,89 @@
+import time
+
+import pytest
+
+from job_store import MAX_ATTEMPTS, JobStore, SQLiteJobStore, _fits
+
+
+@pytest.fixture(params=["memory", "sqlite"])
+def store(request, tmp_path):
+    if request.param == "memory":
+        return JobStore(aging=1.0)
+    return SQLiteJobStore(str(tmp_path / "jobs.sqlite3"), aging=1.0)
+
+
+def _queue(store, job_id, waited=0, **fields):
+    store.add(job_id, dict({"status": "queued", "progress": 0}, **fields))
+    if waited:
+        store.update(job_id, created=time.time() - waited)
+
+
+# --- leases ---
+def test_expired_lease_is_claimed_again(store):
+    _queue(store, "a")
+    assert store.claim("w1", lease=-1) == "a"     # lease already over: w1 counts as gone
+    assert store.claim("w2", lease=60) == "a"
+    assert store.get("a")["lease_owner"] == "w2"
+    assert store.renew(["a"], "w1", 60) == ["a"]
+    assert store.renew(["a"], "w2", 60) == []
+
+
+def test_live_lease_is_not_claimed(store):
+    _queue(store, "a")
+    assert store.claim("w1", lease=60) == "a"
+    assert store.claim("w2", lease=60) is None
+
+
+def test_job_fails_after_max_attempts(store):
+    _queue(store, "a")
+    for _ in range(MAX_ATTEMPTS):
+        assert store.claim("w", lease=-1) == "a"
+    assert store.claim("w", lease=60) is None
+    rec = store.get("a")
+    assert rec["status"] == "error"
+    assert "%d times" % MAX_ATTEMPTS in rec["error"]
+
+
+# --- shortest job first, with aging ---
+def test_shortest_estimate_first(store):
+    _queue(store, "long", cost_seconds=100)
+    _queue(store, "short", cost_seconds=5)
+    assert store.claim("w", lease=60) == "short"
+    assert store.claim("w", lease=60) == "long"
+
+
+def test_waiting_moves_a_long_job_ahead(store):
+    # 100 s of work queued 150 s ago ranks as -50, ahead of a fresh 5 s job
+    _queue(store, "long", waited=150, cost_seconds=100)
+    _queue(store, "short", cost_seconds=5)
+    assert store.claim("w", lease=60) == "long"
+
+
+def test_job_that_does_not_fit_blocks_the_queue(store):
+    budget = {"mem_mb": 1000, "cpu": 4}
+    _queue(store, "running", mem_mb=600, cpu=1)
+    assert store.claim("w", lease=60, budget=budget) == "running"
+    _queue(store, "big", waited=100, mem_mb=600, cpu=1)
+    _queue(store, "small", mem_mb=100, cpu=1)
+    # "big" is next and does not fit; "small" must not overtake it
+    assert store.claim("w", lease=60, budget=budget) is None
+
+
+# --- budget ---
+def test_fits_within_budget():
+    running = [{"mem_mb": 500, "cpu": 1}, {"mem_mb": 200, "cpu": 2}]
+    assert _fits({"mem_mb": 300, "cpu": 1}, running, {"mem_mb": 1000, "cpu": 4})
+    assert not _fits({"mem_mb": 301, "cpu": 1}, running, {"mem_mb": 1000, "cpu": 4})
+    assert not _fits({"mem_mb": 100, "cpu": 2}, running, {"mem_mb": 1000, "cpu": 4})
+
+
+def test_fits_without_budget_or_running_jobs():
+    huge = {"mem_mb": 10 ** 6, "cpu": 64}
+    assert _fits(huge, [], {"mem_mb": 1000, "cpu": 4})      # runs alone
+    assert _fits(huge, [{"mem_mb": 500, "cpu": 1}], None)
+
+
+def test_fits_ignores_unlimited_and_missing_fields():
+    running = [{"mem_mb": 900}]
+    assert _fits({"cpu": 8}, running, {"mem_mb": 1000})
+    assert _fits({}, running, {"mem_mb": 1000, "cpu": 1})
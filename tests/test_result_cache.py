@@ -0,0 +1,66 @@
+import os
+
+from result_cache import ResultCache
+
+
+def _docx(directory, name, size):
+    with open(os.path.join(directory, name), "wb") as f:
+        f.write(b"x" * size)
+    return name
+
+
+def test_evicts_least_recently_used(tmp_path):
+    cache = ResultCache(str(tmp_path), max_bytes=250)
+    cache.put("a", _docx(tmp_path, "a.docx", 100))
+    cache.put("b", _docx(tmp_path, "b.docx", 100))
+    assert cache.get("a") == "a.docx"          # "b" is now the least recently used
+
+    cache.put("c", _docx(tmp_path, "c.docx", 100))
+
+    assert cache.get("b") is None
+    assert not os.path.exists(tmp_path / "b.docx")
+    assert cache.get("a") == "a.docx"
+    assert cache.get("c") == "c.docx"
+    assert cache.files() == {"a.docx", "c.docx"}
+
+
+def test_keeps_a_single_entry_larger_than_the_budget(tmp_path):
+    cache = ResultCache(str(tmp_path), max_bytes=50)
+    cache.put("a", _docx(tmp_path, "a.docx", 100))
+    assert cache.get("a") == "a.docx"
+
+    cache.put("b", _docx(tmp_path, "b.docx", 100))
+    assert cache.get("a") is None
+    assert cache.get("b") == "b.docx"
+
+
+def test_index_is_shared_through_the_directory(tmp_path):
+    ResultCache(str(tmp_path), max_bytes=1000).put("a", _docx(tmp_path, "a.docx", 10))
+    assert ResultCache(str(tmp_path), max_bytes=1000).get("a") == "a.docx"
+
+
+def test_forgets_entries_whose_file_is_gone(tmp_path):
+    cache = ResultCache(str(tmp_path), max_bytes=1000)
+    cache.put("a", _docx(tmp_path, "a.docx", 10))
+    os.remove(tmp_path / "a.docx")
+    assert cache.get("a") is None
+    assert cache.stats()["entries"] == 0
+
+
+def test_spares_files_that_are_still_pinned(tmp_path):
+    referenced = {"a.docx"}
+    cache = ResultCache(str(tmp_path), max_bytes=250, pinned=lambda: referenced)
+    cache.put("a", _docx(tmp_path, "a.docx", 100))
+    cache.put("b", _docx(tmp_path, "b.docx", 100))
+
+    cache.put("c", _docx(tmp_path, "c.docx", 100))
+
+    # "a" is the least recently used, but a job still points at it
+    assert os.path.exists(tmp_path / "a.docx")
+    assert not os.path.exists(tmp_path / "b.docx")
+    assert cache.files() == {"a.docx", "c.docx"}
+
+    referenced.clear()
+    cache.put("d", _docx(tmp_path, "d.docx", 100))
+    assert not os.path.exists(tmp_path / "a.docx")
+    assert cache.files() == {"c.docx", "d.docx"}
@@ -0,0 +1,61 @@
+import pytest
+
+from job_store import JobStore, SQLiteJobStore
+from scheduler import JobScheduler, QueueFull
+
+
+@pytest.fixture(params=["memory", "sqlite"])
+def store(request, tmp_path):
+    if request.param == "memory":
+        return JobStore()
+    return SQLiteJobStore(str(tmp_path / "jobs.sqlite3"))
+
+
+def _scheduler(store, **kwargs):
+    # no worker threads: the tests claim jobs themselves
+    return JobScheduler(lambda job_id: None, store, workers=0, **kwargs)
+
+
+def _batch(n, prefix="j"):
+    return [("%s%d" % (prefix, i), {"status": "queued", "progress": 0}) for i in range(n)]
+
+
+def test_batch_larger_than_the_queue_waits_for_room(store):
+    scheduler = _scheduler(store, max_queue=3, max_waiting=10)
+    scheduler.submit_many(_batch(8))
+    assert (store.queued(), store.waiting()) == (3, 5)
+    assert [store.get("j%d" % i)["status"] for i in (2, 3)] == ["queued", "waiting"]
+
+    claimed = []
+    while len(claimed) < 8:
+        store.admit(scheduler.max_queue)
+        assert store.queued() <= 3
+        job_id = store.claim("w", lease=60)
+        assert job_id is not None
+        claimed.append(job_id)
+    assert sorted(claimed) == sorted("j%d" % i for i in range(8))
+    assert (store.queued(), store.waiting()) == (0, 0)
+
+
+def test_batch_is_refused_while_too_many_documents_wait(store):
+    scheduler = _scheduler(store, max_queue=2, max_waiting=4)
+    scheduler.submit_many(_batch(5, "a"))          # 2 queued, 3 waiting
+    with pytest.raises(QueueFull):
+        scheduler.submit_many(_batch(2, "b"))      # would make 5 waiting
+    assert store.get("b0") is None
+    scheduler.submit_many(_batch(1, "c"))
+    assert store.waiting() == 4
+
+
+def test_batch_without_waiting_room_must_fit_the_queue(store):
+    scheduler = _scheduler(store, max_queue=3)
+    with pytest.raises(QueueFull):
+        scheduler.submit_many(_batch(4))
+    scheduler.submit_many(_batch(3))
+    assert store.queued() == 3
+
+
+def test_waiting_job_can_be_cancelled(store):
+    _scheduler(store, max_queue=1, max_waiting=5).submit_many(_batch(2))
+    assert store.cancel("j1", "Cancelled by the user.") == "cancelled"
+    assert store.admit(5) == 0
@@ -0,0 +1,46 @@
+import io
+import json
+import os
+import zipfile
+
+from zip_stream import CHUNK, ZipStream
+
+
+def test_round_trip_through_zipfile(tmp_path):
+    big = tmp_path / "big.docx"
+    data = os.urandom(3 * CHUNK + 123)          # several chunks
+    big.write_bytes(data)
+    small = tmp_path / "small.txt"
+    small.write_bytes(b"hello " * 1000)
+
+    zs = ZipStream()
+    chunks = []
+    chunks += zs.add_file(str(big), "out/big.docx")
+    chunks += zs.add_file(str(small), "small.txt", compress=True)
+    chunks += zs.add_bytes("manifest.json", json.dumps({"files": 2}))
+    chunks += zs.close()
+
+    with zipfile.ZipFile(io.BytesIO(b"".join(chunks))) as zf:
+        assert zf.testzip() is None
+        assert zf.namelist() == ["out/big.docx", "small.txt", "manifest.json"]
+        assert zf.getinfo("out/big.docx").compress_type == zipfile.ZIP_STORED
+        assert zf.getinfo("small.txt").compress_type == zipfile.ZIP_DEFLATED
+        assert zf.read("out/big.docx") == data
+        assert zf.read("small.txt") == small.read_bytes()
+        assert json.loads(zf.read("manifest.json")) == {"files": 2}
+    assert zs.names == {"out/big.docx", "small.txt", "manifest.json"}
+
+
+def test_chunks_stay_small(tmp_path):
+    path = tmp_path / "big.bin"
+    path.write_bytes(os.urandom(4 * CHUNK))
+    zs = ZipStream()
+    sizes = [len(c) for c in zs.add_file(str(path), "big.bin")]
+    assert max(sizes) <= CHUNK + 1024      # one file chunk plus a header
+    assert sum(sizes) > 4 * CHUNK
+
+
+def test_empty_archive():
+    zs = ZipStream()
+    with zipfile.ZipFile(io.BytesIO(b"".join(zs.close()))) as zf:
+        assert zf.namelist() == []
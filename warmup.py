@@ -0,0 +1,102 @@
+import importlib
+import os
+import shutil
+import subprocess
+import threading
+import time
+
+# heavy converter dependencies, lightest first so each timing is mostly that module's own
+MODULES = ["fitz", "docx", "pdfplumber", "pdf2docx", "PIL.Image", "pytesseract", "pdf2image",
+           "ocrmypdf", "pandas", "tabula", "jpype", "convert_all_in_one"]
+
+
+def _tool_path(path, name):
+    # configured path (bundled tools/ folder, env var) first, then PATH
+    if path and os.path.exists(path):
+        return path
+    return shutil.which(name)
+
+
+class WarmUp:
+    """
+    Loads the converters' dependencies before the first job needs them, on a background
+    thread: imports `modules`, checks that each external tool runs, then calls the
+    `primers` (e.g. start the tabula JVM, run tesseract once). Every step is timed, and
+    report() is what /readyz serves. Started lazily, so importing the app stays cheap.
+
+    tools: {name: (configured path, executable name, version args)}
+    primers: {name: callable}
+    """
+
+    def __init__(self, modules=MODULES, tools=None, primers=None, enabled=True):
+        self.modules = modules
+        self.tools = tools or {}
+        self.primers = primers or {}
+        self.enabled = enabled
+        self.steps = {"imports": {}, "tools": {}, "primers": {}}
+        self.seconds = None
+        self._thread = None
+        self._done = threading.Event()
+        self._lock = threading.Lock()
+        if not enabled:
+            self._done.set()
+
+    @property
+    def ready(self):
+        return self._done.is_set()
+
+    def start(self):
+        if not self.enabled:
+            return
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self.run, name="warm-up", daemon=True)
+                self._thread.start()
+
+    def wait(self, timeout=None):
+        return self._done.wait(timeout)
+
+    def report(self):
+        with self._lock:
+            return {"ready": self.ready, "enabled": self.enabled, "seconds": self.seconds,
+                    "imports": dict(self.steps["imports"]), "tools": dict(self.steps["tools"]),
+                    "primers": dict(self.steps["primers"])}
+
+    def run(self):
+        t0 = time.perf_counter()
+        try:
+            for name in self.modules:
+                self._step("imports", name, importlib.import_module, name)
+            for name, (path, exe, args) in self.tools.items():
+                self._step("tools", name, self._check_tool, path, exe, args)
+            for name, primer in self.primers.items():
+                self._step("primers", name, primer)
+        finally:
+            with self._lock:
+                self.seconds = round(time.perf_counter() - t0, 3)
+            self._done.set()
+            print("warm-up finished in %.1fs: %s" % (self.seconds, ", ".join(
+                "%s %s" % (name, "%.2fs" % r["seconds"] if r["ok"] else "unavailable")
+                for group in self.steps.values() for name, r in group.items())))
+
+    def _step(self, group, name, func, *args):
+        t0 = time.perf_counter()
+        entry = {"ok": True}
+        try:
+            detail = func(*args)
+            if isinstance(detail, str):
+                entry["detail"] = detail
+        except Exception as e:   # a missing optional dependency must not end the warm-up
+            entry = {"ok": False, "error": "%s: %s" % (type(e).__name__, e)}
+        entry["seconds"] = round(time.perf_counter() - t0, 3)
+        with self._lock:
+            self.steps[group][name] = entry
+
+    @staticmethod
+    def _check_tool(path, exe, args):
+        found = _tool_path(path, exe)
+        if not found:
+            raise FileNotFoundError("%s not found at %s or on PATH" % (exe, path))
+        proc = subprocess.run([found] + list(args), capture_output=True, timeout=60)
+        out = (proc.stdout or proc.stderr).decode("utf-8", "replace").strip()
+        return "%s (%s)" % (found, out.splitlines()[0] if out else "exit %d" % proc.returncode)
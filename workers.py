@@ -0,0 +1,170 @@
+import atexit
+import importlib
+import multiprocessing
+import multiprocessing.util
+import os
+import signal
+import weakref
+
+# Modules a converter process imports once at spawn, so jobs never pay for them
+PRELOAD_MODULES = ["conversion", "convert_all_in_one", "pdf2docx", "pdf2image", "docx", "pytesseract", "pdfplumber"]
+
+
+_live = weakref.WeakSet()
+_conn = None   # inside a converter process: the pipe to the parent
+
+
+def report_progress(*payload):
+    """Inside a converter process: send a progress update to the parent's on_progress callback."""
+    if _conn is not None:
+        _conn.send(("progress", payload, 0))
+
+
+class WorkerCrashed(Exception):
+    """The converter process died while running a job."""
+
+
+def _rss_bytes():
+    # current resident set size; /proc is cheap and exact on Linux
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except Exception:
+        pass
+    # elsewhere psutil, if installed; ru_maxrss would be the lifetime peak, which never
+    # drops, so without either the RSS limit is simply not checked
+    try:
+        import psutil
+        return psutil.Process().memory_info().rss
+    except Exception:
+        return 0
+
+
+def _resolve(target):
+    module_name, func_name = target.split(":", 1)
+    return getattr(importlib.import_module(module_name), func_name)
+
+
+def _child_main(conn, preload):
+    global _conn
+    _conn = conn
+    # own process group, so kill() also takes down ocrmypdf, tesseract and java children
+    if hasattr(os, "setsid"):
+        os.setsid()
+    for name in preload:
+        try:
+            importlib.import_module(name)
+        except Exception as e:
+            print("worker preload skipped", name, ":", e)
+
+    while True:
+        try:
+            msg = conn.recv()
+        except EOFError:
+            break
+        if msg is None:
+            break
+        target, args = msg
+        try:
+            result = _resolve(target)(*args)
+            conn.send(("ok", result, _rss_bytes()))
+        except Exception as e:
+            conn.send(("error", "%s: %s" % (type(e).__name__, e), _rss_bytes()))
+    conn.close()
+
+
+class ConverterProcess:
+    """
+    A long-lived, pre-warmed converter process that runs one job at a time.
+    The process is recycled after `max_jobs` jobs or once its RSS exceeds
+    `max_rss_mb`, and respawned transparently on the next call.
+    """
+
+    def __init__(self, max_jobs=50, max_rss_mb=1500, preload=None):
+        self.max_jobs = max_jobs
+        self.max_rss = max_rss_mb * 1024 * 1024
+        self.preload = PRELOAD_MODULES if preload is None else preload
+        self._ctx = multiprocessing.get_context("spawn")
+        self._proc = None
+        self._conn = None
+        self._jobs = 0
+
+    def call(self, target, *args, on_progress=None):
+        """
+        Run `module:function` with args in the worker process and return its result.
+        Updates the function sends with report_progress() go to on_progress(*payload).
+        """
+        if self._proc is None or not self._proc.is_alive():
+            self._spawn()
+        try:
+            self._conn.send((target, args))
+            while True:
+                status, value, rss = self._conn.recv()
+                if status != "progress":
+                    break
+                if on_progress is not None:
+                    try:
+                        on_progress(*value)
+                    except Exception as e:
+                        print("progress callback failed:", e)
+        except (EOFError, OSError, BrokenPipeError):
+            self.stop()
+            raise WorkerCrashed("converter process exited while running " + target)
+
+        self._jobs += 1
+        if self._jobs >= self.max_jobs or (self.max_rss and rss > self.max_rss):
+            self.stop()
+
+        if status == "error":
+            raise RuntimeError(value)
+        return value
+
+    def kill(self):
+        """
+        Kill the process and everything it started, e.g. from another thread to abandon the
+        running call; that call then raises WorkerCrashed and the next one respawns.
+        """
+        proc = self._proc
+        if proc is None or proc.pid is None:
+            return
+        try:
+            if hasattr(os, "killpg"):
+                os.killpg(proc.pid, signal.SIGKILL)
+            else:
+                proc.kill()
+        except (ProcessLookupError, PermissionError):
+            pass
+
+    def stop(self):
+        if self._conn is not None:
+            try:
+                self._conn.send(None)
+            except Exception:
+                pass
+            self._conn.close()
+        if self._proc is not None:
+            self._proc.join(timeout=5)
+            if self._proc.is_alive():
+                self._proc.kill()
+                self._proc.join()
+        self._proc = None
+        self._conn = None
+        self._jobs = 0
+
+    def _spawn(self):
+        self.stop()
+        parent_conn, child_conn = self._ctx.Pipe()
+        # not a daemon: pdf2docx and ocrmypdf start process pools of their own
+        self._proc = self._ctx.Process(target=_child_main, args=(child_conn, self.preload))
+        self._proc.start()
+        child_conn.close()
+        self._conn = parent_conn
+        _live.add(self)
+
+
+# registered after multiprocessing.util's own exit hook (imported above) so it runs first:
+# that hook joins non-daemon children, which only exit once stop() has told them to
+@atexit.register
+def _stop_all():
+    for worker in list(_live):
+        worker.stop()
@@ -0,0 +1,63 @@
+import zipfile
+
+CHUNK = 256 * 1024
+
+
+class _Sink:
+    """Write-only file object for ZipFile; the bytes written so far are taken with drain()."""
+
+    def __init__(self):
+        self._chunks = []
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        data, self._chunks = b"".join(self._chunks), []
+        return data
+
+
+class ZipStream:
+    """
+    A ZIP archive produced as a sequence of byte chunks, e.g. for a streamed HTTP response.
+    The output is never seeked (entries carry data descriptors), so only the chunk being
+    copied is in memory, whatever the size of the archive.
+
+        zs = ZipStream()
+        yield from zs.add_file(path, "report.docx")
+        yield from zs.add_bytes("manifest.json", data)
+        yield from zs.close()
+    """
+
+    def __init__(self):
+        self._sink = _Sink()
+        self._zip = zipfile.ZipFile(self._sink, "w")
+        self.names = set()
+
+    def add_file(self, path, arcname, compress=False):
+        """Copy a file into the archive; DOCX and other zipped formats are stored as they are."""
+        info = zipfile.ZipInfo.from_file(path, arcname)   # file_size lets ZipFile pick ZIP64 upfront
+        info.compress_type = zipfile.ZIP_DEFLATED if compress else zipfile.ZIP_STORED
+        self.names.add(arcname)
+        with open(path, "rb") as src, self._zip.open(info, "w") as dst:
+            while True:
+                chunk = src.read(CHUNK)
+                if not chunk:
+                    break
+                dst.write(chunk)
+                yield self._sink.drain()
+        yield self._sink.drain()
+
+    def add_bytes(self, arcname, data):
+        self.names.add(arcname)
+        self._zip.writestr(arcname, data, compress_type=zipfile.ZIP_DEFLATED)
+        yield self._sink.drain()
+
+    def close(self):
+        """The central directory, which ends the archive."""
+        self._zip.close()
+        yield self._sink.drain()